@@ -1,26 +1,176 @@
+import time
+STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
+import tkinter.font as tkfont
 import datetime
-import time
+import bisect
+import collections
+import argparse
+import concurrent.futures
 import threading
-import chess
-import random
-import json
+import sys
 import os
+# python-chess and the puzzle store are imported in the background once the
+# window is up, see ChessPuzzleAlarm.preload
+from alarm_scheduler import AlarmScheduler
+from alarm_service import AlarmService
+from ui_bridge import UIBridge
+import metrics
+from alarm_audio import AlarmPlayer, default_sink_factory
+from alarm_store import decode_alarm, JournalLockedError, MISSED_POLICIES
+
+# Seconds over which an escalating alarm reaches the configured volume
+ALARM_RAMP_SECONDS = 60.0
+
+# Search budget for judging alternative answers, keeps the UI responsive
+SOLVER_NODE_LIMIT = 20000
+
+# Seconds before an alarm that its puzzle is picked and prepared
+PREFETCH_LEAD_SECONDS = 60.0
+# Broken puzzles skipped while prefetching before giving up
+PREFETCH_ATTEMPTS = 3
+
+class StartupProfiler:
+    """Collects named timestamps from process start to the first drawn frame"""
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.marks = []
+        self.reported = False
+    
+    @staticmethod
+    def process_age():
+        """Seconds since the process was created, if the OS can tell us"""
+        try:
+            with open("/proc/self/stat") as f:
+                # Field 22 is the start time in clock ticks since boot
+                start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+            with open("/proc/uptime") as f:
+                uptime = float(f.read().split()[0])
+            return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+    
+    def mark(self, name):
+        if self.enabled:
+            with self.lock:
+                self.marks.append((name, time.perf_counter()))
+    
+    def watch_first_frame(self, root):
+        if not self.enabled:
+            return
+        
+        def on_map(event):
+            if event.widget is root and not self.reported:
+                # Wait for the pending redraws of the first frame to be flushed
+                root.update_idletasks()
+                self.mark("first frame")
+                self.report()
+        
+        root.bind("<Map>", on_map, add="+")
+    
+    def report(self):
+        self.reported = True
+        age = self.process_age()
+        
+        lines = ["Startup profile (ms since script start, step time):"]
+        if age is not None:
+            # Interpreter start-up happened before STARTUP_T0 was taken
+            interpreter = max(0.0, age - (time.perf_counter() - STARTUP_T0))
+            lines.append(f"  {-interpreter * 1000:8.1f}  {interpreter * 1000:8.1f}  interpreter start")
+        previous = STARTUP_T0
+        with self.lock:
+            marks = sorted(self.marks, key=lambda mark: mark[1])
+        for name, stamp in marks:
+            lines.append(f"  {(stamp - STARTUP_T0) * 1000:8.1f}  {(stamp - previous) * 1000:8.1f}  {name}")
+            previous = stamp
+        if age is not None:
+            lines.append(f"  process start to first frame: {(interpreter + previous - STARTUP_T0) * 1000:.1f} ms")
+        print("\n".join(lines), file=sys.stderr)
+
+class PieceImageCache:
+    """Bounded LRU cache of rasterized piece glyphs keyed by (piece, size, color)
+    
+    Glyphs are drawn with Pillow once per key, so resizing back to a
+    previous size or switching themes reuses images instead of laying out
+    font glyphs again. Only usable when Pillow and a font with the chess
+    symbols are available; see create().
+    """
+    
+    FONT_CANDIDATES = ("DejaVuSans.ttf", "seguisym.ttf", "Arial Unicode.ttf", "FreeSerif.ttf")
+    
+    def __init__(self, master, font_path, max_entries=96):
+        from PIL import Image, ImageDraw, ImageFont, ImageTk
+        self.Image, self.ImageDraw, self.ImageFont, self.ImageTk = Image, ImageDraw, ImageFont, ImageTk
+        self.master = master
+        self.font_path = font_path
+        self.max_entries = max_entries
+        self.images = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @classmethod
+    def create(cls, master):
+        """A cache if Pillow can render chess glyphs here, otherwise None"""
+        try:
+            from PIL import ImageFont
+        except ImportError:
+            return None
+        for font_path in cls.FONT_CANDIDATES:
+            try:
+                ImageFont.truetype(font_path, 12)
+            except OSError:
+                continue
+            return cls(master, font_path)
+        return None
+    
+    def get(self, glyph, size, color):
+        key = (glyph, size, color)
+        image = self.images.get(key)
+        if image is not None:
+            self.hits += 1
+            self.images.move_to_end(key)
+            return image
+        
+        self.misses += 1
+        font = self.ImageFont.truetype(self.font_path, max(1, int(size * 0.8)))
+        canvas = self.Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        draw = self.ImageDraw.Draw(canvas)
+        draw.text((size / 2, size / 2), glyph, font=font, fill=color, anchor="mm")
+        image = self.ImageTk.PhotoImage(canvas, master=self.master)
+        
+        self.images[key] = image
+        if len(self.images) > self.max_entries:
+            self.images.popitem(last=False)
+        return image
+
 
 class ChessBoardCanvas(tk.Canvas):
-    """Custom chess board renderer using Tkinter Canvas"""
+    """Custom chess board renderer using Tkinter Canvas
+    
+    The board fills the canvas: the square size follows the widget size,
+    recomputed once resizing settles (RESIZE_DEBOUNCE_MS after the last
+    <Configure> event).
+    """
+    
+    RESIZE_DEBOUNCE_MS = 100
+    MIN_SQUARE_SIZE = 20
     
     def __init__(self, parent, **kwargs):
         super().__init__(parent, **kwargs)
         self.square_size = 50
         self.board_size = self.square_size * 8
-        self.config(width=self.board_size, height=self.board_size)
+        self.origin = (0, 0)  # top left corner of the board, centered in the canvas
+        self.config(width=self.board_size, height=self.board_size, highlightthickness=0)
         
         # Colors
         self.light_color = "#F0D9B5"  # Light squares
         self.dark_color = "#B58863"   # Dark squares
         self.highlight_color = "#AAD955"  # Highlighted squares
+        self.piece_colors = {True: "black", False: "white"}  # keyed by "is a white piece"
         
         # Unicode chess piece symbols
         self.pieces = {
@@ -28,197 +178,429 @@ class ChessBoardCanvas(tk.Canvas):
             'p': '♟', 'n': '♞', 'b': '♝', 'r': '♜', 'q': '♛', 'k': '♚',  # Black pieces
         }
         
-        # Font for pieces
-        self.piece_font = ("Arial", int(self.square_size * 0.7), "bold")
+        # Pre-rendered piece images when Pillow is available, otherwise text
+        # items sharing one named font that is resized with a single call
+        self.piece_images = PieceImageCache.create(self)
+        self.piece_font = tkfont.Font(root=self, family="Arial", size=-int(self.square_size * 0.7), weight="bold")
+        self.label_font = tkfont.Font(root=self, family="Arial", size=10)
+        
+        # Canvas item ids, created once and reused on every redraw
+        self.square_items = {}  # square -> rectangle id
+        self.piece_items = {}   # square -> text or image id
+        self.rank_labels = {}   # row -> text id
+        self.file_labels = {}   # col -> text id
+        self.drawn_pieces = {}  # square -> piece symbol currently shown
+        
+        self.resize_job = None
+        self.bind("<Configure>", self.on_configure)
         
         # Initialize board
+        import chess
         self.board = chess.Board()
+        self.create_items()
         self.draw_board()
     
-    def draw_board(self):
-        """Draw the chess board and pieces"""
-        self.delete("all")  # Clear canvas
-        
-        # Draw board squares
-        for row in range(8):
-            for col in range(8):
-                x1 = col * self.square_size
-                y1 = row * self.square_size
-                x2 = x1 + self.square_size
-                y2 = y1 + self.square_size
-                
-                # Alternate square colors
-                color = self.light_color if (row + col) % 2 == 0 else self.dark_color
-                self.create_rectangle(x1, y1, x2, y2, fill=color, outline="")
-                
-                # Add coordinate labels
-                if col == 0:  # Left edge - row numbers
-                    self.create_text(
-                        x1 + 5, 
-                        y1 + self.square_size/2, 
-                        text=str(8-row),
-                        anchor="w",
-                        font=("Arial", 10),
-                        fill="#000000" if (row % 2 == 0) else "#FFFFFF"
-                    )
-                
-                if row == 7:  # Bottom edge - column letters
-                    self.create_text(
-                        x1 + self.square_size/2, 
-                        y2 - 5, 
-                        text=chr(97 + col),  # 'a' through 'h'
-                        anchor="s",
-                        font=("Arial", 10),
-                        fill="#000000" if ((row + col) % 2 == 0) else "#FFFFFF"
-                    )
-        
-        # Draw pieces
+    def square_box(self, col, row):
+        x1 = self.origin[0] + col * self.square_size
+        y1 = self.origin[1] + row * self.square_size
+        return x1, y1, x1 + self.square_size, y1 + self.square_size
+    
+    def create_items(self):
+        """Create the square, coordinate and piece items once, tagged by square"""
+        import chess
         for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if piece:
-                # Calculate position
-                col = chess.square_file(square)
-                row = 7 - chess.square_rank(square)  # Flip because chess board has rank 8 at the top
-                
-                x = col * self.square_size + self.square_size / 2
-                y = row * self.square_size + self.square_size / 2
-                
-                # Get piece symbol
-                symbol = self.pieces[piece.symbol()]
-                
-                # Draw piece
-                self.create_text(
-                    x, y, 
-                    text=symbol, 
-                    font=self.piece_font,
-                    fill="white" if piece.color == chess.BLACK else "black"
+            col = chess.square_file(square)
+            row = 7 - chess.square_rank(square)  # Flip because chess board has rank 8 at the top
+            name = chess.square_name(square)
+            
+            # Alternate square colors
+            shade = "light" if (row + col) % 2 == 0 else "dark"
+            self.square_items[square] = self.create_rectangle(
+                0, 0, 0, 0, outline="", tags=("square", shade, "sq_" + name)
+            )
+            
+            # Add coordinate labels
+            if col == 0:  # Left edge - row numbers
+                self.rank_labels[row] = self.create_text(
+                    0, 0,
+                    text=str(8-row),
+                    anchor="w",
+                    font=self.label_font,
+                    fill="#000000" if (row % 2 == 0) else "#FFFFFF",
+                    tags=("coord",)
                 )
+            
+            if row == 7:  # Bottom edge - column letters
+                self.file_labels[col] = self.create_text(
+                    0, 0,
+                    text=chr(97 + col),  # 'a' through 'h'
+                    anchor="s",
+                    font=self.label_font,
+                    fill="#000000" if ((row + col) % 2 == 0) else "#FFFFFF",
+                    tags=("coord",)
+                )
+            
+            # Empty piece slot, filled in by draw_square
+            if self.piece_images:
+                self.piece_items[square] = self.create_image(0, 0, tags=("piece", "pc_" + name))
+            else:
+                self.piece_items[square] = self.create_text(
+                    0, 0, text="", font=self.piece_font, tags=("piece", "pc_" + name)
+                )
+        
+        # Keep labels and pieces above the squares
+        self.tag_raise("coord")
+        self.tag_raise("piece")
+        self.layout()
+    
+    def layout(self):
+        """Move every item to the current square size; only called on resize"""
+        import chess
+        for square in chess.SQUARES:
+            col = chess.square_file(square)
+            row = 7 - chess.square_rank(square)
+            x1, y1, x2, y2 = self.square_box(col, row)
+            self.coords(self.square_items[square], x1, y1, x2, y2)
+            self.coords(self.piece_items[square], (x1 + x2) / 2, (y1 + y2) / 2)
+        for row, item in self.rank_labels.items():
+            x1, y1, x2, y2 = self.square_box(0, row)
+            self.coords(item, x1 + 5, (y1 + y2) / 2)
+        for col, item in self.file_labels.items():
+            x1, y1, x2, y2 = self.square_box(col, 7)
+            self.coords(item, (x1 + x2) / 2, y2 - 5)
+        
+        # Negative sizes are in pixels, so the glyphs track the squares exactly
+        self.piece_font.configure(size=-int(self.square_size * 0.7))
+        self.label_font.configure(size=max(7, self.square_size // 5))
+    
+    def on_configure(self, event):
+        # Window managers send a stream of these while dragging; only act
+        # once the size has settled
+        if self.resize_job is not None:
+            self.after_cancel(self.resize_job)
+        self.resize_job = self.after(self.RESIZE_DEBOUNCE_MS, self.resize, event.width, event.height)
+    
+    def resize(self, width, height):
+        self.resize_job = None
+        square_size = max(self.MIN_SQUARE_SIZE, min(width, height) // 8)
+        origin = ((width - square_size * 8) // 2, (height - square_size * 8) // 2)
+        if square_size == self.square_size and origin == self.origin:
+            return
+        
+        self.square_size = square_size
+        self.board_size = square_size * 8
+        self.origin = (max(0, origin[0]), max(0, origin[1]))
+        self.layout()
+        if self.piece_images:
+            # Images are per size: swap every piece to the new size
+            self.draw_board()
+    
+    def draw_square(self, square, symbol):
+        """Show the piece with the given symbol (or nothing) on one square"""
+        item = self.piece_items[square]
+        if symbol is None:
+            if self.piece_images:
+                self.itemconfig(item, image="")
+            else:
+                self.itemconfig(item, text="")
+        else:
+            color = self.piece_colors[symbol.isupper()]
+            if self.piece_images:
+                self.itemconfig(item, image=self.piece_images.get(self.pieces[symbol], self.square_size, color))
+            else:
+                self.itemconfig(item, text=self.pieces[symbol], fill=color)
+        self.drawn_pieces[square] = symbol
+    
+    def draw_board(self):
+        """Recolor every square and redraw every piece from self.board"""
+        import chess
+        with metrics.BOARD_DRAW.time():
+            self.itemconfig("light", fill=self.light_color)
+            self.itemconfig("dark", fill=self.dark_color)
+            
+            for square in chess.SQUARES:
+                piece = self.board.piece_at(square)
+                self.draw_square(square, piece.symbol() if piece else None)
+    
+    def set_colors(self, light_color, dark_color):
+        """Change the square colors without touching the pieces"""
+        self.light_color = light_color
+        self.dark_color = dark_color
+        self.itemconfig("light", fill=self.light_color)
+        self.itemconfig("dark", fill=self.dark_color)
+    
+    def prerender(self, board):
+        """Render the piece images a position needs before it is shown"""
+        if self.piece_images:
+            for piece in board.piece_map().values():
+                symbol = piece.symbol()
+                self.piece_images.get(self.pieces[symbol], self.square_size, self.piece_colors[symbol.isupper()])
     
     def update_board(self, board):
-        """Update with a new board position"""
+        """Update with a new board position, redrawing only changed squares"""
         self.board = board
-        self.draw_board()
+        
+        # Compare against what is on screen rather than the previous board
+        # object, since callers push moves onto the same board in place
+        with metrics.BOARD_DRAW.time():
+            new_pieces = {square: piece.symbol() for square, piece in board.piece_map().items()}
+            for square in set(self.drawn_pieces) | set(new_pieces):
+                symbol = new_pieces.get(square)
+                if self.drawn_pieces.get(square) != symbol:
+                    self.draw_square(square, symbol)
+
+class AlarmListView(ttk.Frame):
+    """Virtualized list of alarms keyed by alarm id
+    
+    Alarms are kept sorted by fire time in a flat list; inserting or removing
+    one is a bisect plus a single list operation, and the label text is
+    formatted once per alarm. Only the rows that fit in the visible window
+    are ever put into the Listbox, so the widget cost does not depend on the
+    number of alarms.
+    """
+    
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        
+        self.keys = []    # sorted (timestamp, alarm id)
+        self.labels = {}  # alarm id -> row text
+        self.offset = 0   # index of the first visible row
+        self.selected = None
+        self.render_pending = False
+        
+        self.scrollbar = ttk.Scrollbar(self, command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        
+        self.listbox = tk.Listbox(self, exportselection=False)
+        self.listbox.pack(fill="both", expand=True)
+        self.row_height = tkfont.nametofont(self.listbox.cget("font")).metrics("linespace") + 1
+        
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.listbox.bind("<Configure>", lambda event: self.schedule_render())
+        self.listbox.bind("<MouseWheel>", self.on_wheel)
+        self.listbox.bind("<Button-4>", lambda event: self.scroll_rows(-3))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll_rows(3))
+    
+    @staticmethod
+    def format_alarm(alarm):
+        text = f"{alarm['time'].strftime('%H:%M')} - {alarm['difficulty']}"
+        if alarm.get("repeat"):
+            text += f" - {alarm['repeat']} (next {alarm['time'].strftime('%a %d %b')})"
+        return text
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def insert(self, alarm):
+        key = (alarm["time"].timestamp(), alarm["id"])
+        bisect.insort(self.keys, key)
+        self.labels[alarm["id"]] = self.format_alarm(alarm)
+        self.schedule_render()
+    
+    def remove(self, alarm):
+        key = (alarm["time"].timestamp(), alarm["id"])
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.labels[alarm["id"]]
+            if self.selected == alarm["id"]:
+                self.selected = None
+            self.schedule_render()
+    
+    def clear(self):
+        self.keys = []
+        self.labels = {}
+        self.selected = None
+        self.schedule_render()
+    
+    def selected_id(self):
+        return self.selected
+    
+    def visible_rows(self):
+        return max(1, self.listbox.winfo_height() // self.row_height)
+    
+    def schedule_render(self):
+        # Any number of changes before the next idle period render once
+        if not self.render_pending:
+            self.render_pending = True
+            self.after_idle(self.render)
+    
+    def render(self):
+        """Fill the Listbox with just the visible window of rows"""
+        self.render_pending = False
+        rows = self.visible_rows()
+        self.offset = max(0, min(self.offset, len(self.keys) - rows))
+        window = self.keys[self.offset:self.offset + rows]
+        
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *[self.labels[alarm_id] for _, alarm_id in window])
+        for row, (_, alarm_id) in enumerate(window):
+            if alarm_id == self.selected:
+                self.listbox.selection_set(row)
+        
+        if self.keys:
+            self.scrollbar.set(self.offset / len(self.keys), min(1.0, (self.offset + rows) / len(self.keys)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def on_select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection and self.offset + selection[0] < len(self.keys):
+            self.selected = self.keys[self.offset + selection[0]][1]
+    
+    def scroll_rows(self, delta):
+        self.offset += delta
+        self.render()
+    
+    def on_wheel(self, event):
+        self.scroll_rows(-3 if event.delta > 0 else 3)
+    
+    def yview(self, *args):
+        """Scrollbar callback, in the same form as the Listbox yview command"""
+        rows = self.visible_rows()
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.keys))
+        elif args[0] == "scroll":
+            step = rows if args[2] == "pages" else 1
+            self.offset += int(args[1]) * step
+        self.render()
 
 class ChessPuzzleAlarm:
-    def __init__(self, root):
+    def __init__(self, root, missed_alarm_policy="fire", profiler=None, audio_sink="auto", audio_wav="alarm.wav",
+                 daemon_socket=None, prefetch_lead=PREFETCH_LEAD_SECONDS):
         self.root = root
         self.root.title("Chess Puzzle Alarm Clock")
         self.root.geometry("800x650")
         self.root.resizable(True, True)
         
-        self.alarms = []
+        self.alarms = {}  # alarm id -> alarm
         self.current_alarm = None
         self.alarm_active = False
-        self.alarm_thread = None
+        self.alarm_player = None
         self.puzzle_thread = None
         
-        self.board = chess.Board()
+        # Sound settings are read when an alarm fires, even if the Settings
+        # tab has never been opened
+        self.volume_var = tk.DoubleVar(value=70)  # Default volume
+        self.ramp_var = tk.BooleanVar(value=False)
+        self.auto_increase_var = tk.BooleanVar(value=False)
+        self.sink_factory = default_sink_factory(audio_sink, audio_wav, ring=lambda: self.ui.post_coalesced("bell", self.root.bell))
+        
+        self.board = None
         self.current_puzzle = None
-        self.expected_move = None
+        self.session = None
+        self.remote_session = False
+        self.answers = None
+        self.puzzle_shown_at = None
+        self.attempts = 0
         
+        # Alarm puzzles are picked and prepared prefetch_lead seconds ahead,
+        # on a worker thread, so they are ready the moment the alarm rings
+        self.prefetch_lead = prefetch_lead
+        self.prefetched = {}  # alarm id -> prepared puzzle
+        self.prefetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.prefetch_scheduler = AlarmScheduler(lambda entry: self.ui.post(self.start_prefetch, entry["id"]))
+        
+        self.profiler = profiler or StartupProfiler(enabled=False)
+        self.ui = UIBridge(self.root)
         self.setup_ui()
+        self.profiler.mark("alarm tab built")
+        self.prefetch_scheduler.start()
+        # Alarms are kept by the alarm daemon when one is given, otherwise
+        # by an alarm service inside this process
+        self.daemon = None
+        self.daemon_socket = daemon_socket
+        self.alarm_service = None
+        self.missed_alarm_policy = missed_alarm_policy
+        if daemon_socket is not None:
+            self.connect_daemon(daemon_socket)
+        if self.daemon is None:
+            self.restore_alarms(missed_alarm_policy)
+        self.profiler.mark("alarms restored")
         self.setup_puzzles()
-        self.check_alarms_thread = threading.Thread(target=self.check_alarms, daemon=True)
-        self.check_alarms_thread.start()
     
     def setup_puzzles(self):
-        # Sample puzzles - in a real app, you'd have a larger database
-        self.puzzles = [
-            {
-                "fen": "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 1",
-                "description": "Find the best move for White",
-                "solution": "f3d5",  # Knight takes e5
-                "difficulty": "easy"
-            },
-            {
-                "fen": "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 1",
-                "description": "Find the fork",
-                "solution": "f3g5",  # Knight to g5 fork
-                "difficulty": "easy"
-            },
-            {
-                "fen": "r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNB1K2R b KQkq - 0 1",
-                "description": "Find the best defense",
-                "solution": "d8f7",  # Queen takes queen
-                "difficulty": "medium"
-            },
-            {
-                "fen": "r3k2r/pp3ppp/2p5/4Pb2/2B2P2/8/PPP3PP/R3K2R w KQkq - 0 1",
-                "description": "Mate in 1",
-                "solution": "c4f7",  # Bishop checkmate
-                "difficulty": "easy"
-            },
-            {
-                "fen": "3r1rk1/pp3ppp/2p5/8/3P4/8/PPP2PPP/R3K2R w KQ - 0 1",
-                "description": "Find the best move",
-                "solution": "e1c1",  # Castle queenside
-                "difficulty": "medium"
-            },
-            {
-                "fen": "r1bq1rk1/pp2ppbp/2np1np1/8/2BNP3/2N1BP2/PPP3PP/R2QK2R w KQ - 0 1",
-                "description": "Find the best move for White",
-                "solution": "d4f5",  # Knight to f5
-                "difficulty": "medium"
-            },
-            {
-                "fen": "r4rk1/pp1n1ppp/2p1p3/q2p4/8/P1NPP1P1/1PPQ1PBP/R3K2R w KQ - 0 1",
-                "description": "Find the best move for White",
-                "solution": "d3d4",  # Opening the diagonal for the bishop
-                "difficulty": "medium"
-            },
-            {
-                "fen": "r1b1kb1r/pp3ppp/2n1pn2/q1pp4/3P4/P1N1PN2/1PP1BPPP/R1BQK2R w KQkq - 0 1",
-                "description": "Find a strong developing move",
-                "solution": "c1g5",  # Bishop to g5
-                "difficulty": "medium"
-            },
-            {
-                "fen": "r3kb1r/ppp2ppp/2n1b3/3q4/3pN3/8/PPP2PPP/RNBQR1K1 w kq - 0 1",
-                "description": "Find the winning tactic",
-                "solution": "e4d6",  # Knight fork
-                "difficulty": "easy"
-            },
-            {
-                "fen": "2r3k1/pp2ppbp/3p2p1/3P4/3b4/P4N2/1P3PPP/2B1R1K1 w - - 0 1",
-                "description": "Find the best move for White",
-                "solution": "c1h6",  # Bishop to h6
-                "difficulty": "hard"
-            }
-        ]
-        
-        # Check if we have a local file with saved puzzles and load it
-        if os.path.exists("chess_puzzles.json"):
-            try:
-                with open("chess_puzzles.json", "r") as f:
-                    additional_puzzles = json.load(f)
-                    self.puzzles.extend(additional_puzzles)
-            except:
-                pass
+        # Puzzles live in an indexed on-disk store; it is opened, along with
+        # the python-chess import, on a background thread
+        self.puzzle_store = None
+        self.puzzle_selector = None
+        self.puzzle_error = None
+        self.puzzles_ready = threading.Event()
+        self.fallback_lock = threading.Lock()
+        self.puzzle_thread = threading.Thread(target=self.preload, daemon=True)
+        self.puzzle_thread.start()
+    
+    def preload(self):
+        try:
+            import chess  # noqa: F401 - warms the module cache for the main thread
+            self.profiler.mark("python-chess imported (background)")
+            from puzzle_store import PuzzleStore
+            from puzzle_rating import PuzzleSelector
+            self.puzzle_store = PuzzleStore()
+            self.puzzle_selector = PuzzleSelector(self.puzzle_store)
+            self.profiler.mark("puzzle store opened (background)")
+        except Exception as e:
+            # Kept for get_puzzle_store, which falls back to the built-in puzzles
+            self.puzzle_error = e
+        finally:
+            self.puzzles_ready.set()
+    
+    def get_puzzle_store(self):
+        # Only blocks if a puzzle is needed within the first moments of startup
+        self.puzzles_ready.wait()
+        with self.fallback_lock:
+            if self.puzzle_store is None:
+                from puzzle_store import PuzzleStore
+                from puzzle_rating import PuzzleSelector
+                print(f"Could not open the puzzle database, using the built-in puzzles: {self.puzzle_error!r}", file=sys.stderr)
+                self.puzzle_store = PuzzleStore(":memory:", legacy_json=None)
+                self.puzzle_selector = PuzzleSelector(self.puzzle_store)
+        return self.puzzle_store
     
     def setup_ui(self):
-        notebook = ttk.Notebook(self.root)
-        notebook.pack(expand=True, fill="both", padx=10, pady=10)
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(expand=True, fill="both", padx=10, pady=10)
+        
+        # Shown above the tabs while an alarm rings; unlike a dialog it leaves
+        # the puzzle usable straight away
+        self.alarm_banner = tk.Label(
+            self.root, text="Time to wake up! Solve the chess puzzle to stop the alarm.",
+            bg="#C62828", fg="white", font=("Arial", 14, "bold"), pady=8
+        )
         
         # Alarm Tab
-        alarm_tab = ttk.Frame(notebook)
-        notebook.add(alarm_tab, text="Alarm")
+        alarm_tab = ttk.Frame(self.notebook)
+        self.notebook.add(alarm_tab, text="Alarm")
         
         # Puzzle Tab
-        puzzle_tab = ttk.Frame(notebook)
-        notebook.add(puzzle_tab, text="Puzzle")
+        self.puzzle_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.puzzle_tab, text="Puzzle")
         
         # Settings Tab
-        settings_tab = ttk.Frame(notebook)
-        notebook.add(settings_tab, text="Settings")
+        self.settings_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.settings_tab, text="Settings")
         
         # Setup Alarm Tab
         self.setup_alarm_tab(alarm_tab)
         
-        # Setup Puzzle Tab
-        self.setup_puzzle_tab(puzzle_tab)
-        
-        # Setup Settings Tab
-        self.setup_settings_tab(settings_tab)
+        # The Puzzle and Settings tabs are built the first time they are needed
+        self.tab_builders = {
+            str(self.puzzle_tab): (self.puzzle_tab, self.setup_puzzle_tab),
+            str(self.settings_tab): (self.settings_tab, self.setup_settings_tab)
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+    
+    def on_tab_changed(self, event=None):
+        self.build_tab(self.notebook.select())
+    
+    def build_tab(self, tab):
+        builder = self.tab_builders.pop(str(tab), None)
+        if builder is not None:
+            frame, setup = builder
+            setup(frame)
+    
+    def ensure_puzzle_tab(self):
+        self.build_tab(self.puzzle_tab)
     
     def setup_alarm_tab(self, parent):
         # Alarm setting frame
@@ -247,27 +629,32 @@ class ChessPuzzleAlarm:
         difficulty_combo['values'] = ('easy', 'medium', 'hard')
         difficulty_combo.pack(side="left", padx=5)
         
+        # Repeat rule; any rule alarm_recurrence understands can be typed in
+        repeat_frame = ttk.Frame(set_frame)
+        repeat_frame.pack(fill="x", padx=5, pady=5)
+        
+        ttk.Label(repeat_frame, text="Repeat:").pack(side="left", padx=5)
+        self.repeat_var = tk.StringVar(value="never")
+        repeat_combo = ttk.Combobox(repeat_frame, textvariable=self.repeat_var, width=24)
+        repeat_combo['values'] = ('never', 'daily', 'weekdays', 'weekends', 'mon,wed,fri', 'every 2 days',
+                                  'cron 30 7 * * 1-5')
+        repeat_combo.pack(side="left", padx=5)
+        
         # Set alarm button
-        set_button = ttk.Button(set_frame, text="Set Alarm", command=self.set_alarm)
-        set_button.pack(pady=10)
+        self.set_button = ttk.Button(set_frame, text="Set Alarm", command=self.set_alarm)
+        self.set_button.pack(pady=10)
         
         # Alarms list
         alarms_frame = ttk.LabelFrame(parent, text="Active Alarms")
         alarms_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
-        # Scrollable list for alarms
-        scrollbar = ttk.Scrollbar(alarms_frame)
-        scrollbar.pack(side="right", fill="y")
-        
-        self.alarms_listbox = tk.Listbox(alarms_frame)
-        self.alarms_listbox.pack(fill="both", expand=True, padx=5, pady=5)
-        
-        self.alarms_listbox.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=self.alarms_listbox.yview)
+        # Scrollable list for alarms, only the visible rows are rendered
+        self.alarms_view = AlarmListView(alarms_frame)
+        self.alarms_view.pack(fill="both", expand=True, padx=5, pady=5)
         
         # Delete alarm button
-        delete_button = ttk.Button(alarms_frame, text="Delete Selected", command=self.delete_alarm)
-        delete_button.pack(pady=5)
+        self.delete_button = ttk.Button(alarms_frame, text="Delete Selected", command=self.delete_alarm)
+        self.delete_button.pack(pady=5)
     
     def setup_puzzle_tab(self, parent):
         # Puzzle display frame
@@ -276,7 +663,7 @@ class ChessPuzzleAlarm:
         
         # Chess board display
         self.board_canvas = ChessBoardCanvas(self.puzzle_frame, bg="white")
-        self.board_canvas.pack(pady=10)
+        self.board_canvas.pack(fill="both", expand=True, pady=10)
         
         # Puzzle description
         self.puzzle_description = ttk.Label(self.puzzle_frame, text="No active puzzle", font=("Arial", 12, "bold"))
@@ -289,6 +676,13 @@ class ChessPuzzleAlarm:
         ttk.Label(move_frame, text="Your move (e.g. e2e4):").pack(side="left", padx=5)
         self.move_entry = ttk.Entry(move_frame)
         self.move_entry.pack(side="left", expand=True, fill="x", padx=5)
+        self.move_entry.bind("<KeyRelease>", self.update_move_hints)
+        self.move_entry.bind("<Tab>", self.complete_move)
+        self.move_entry.bind("<Return>", lambda event: self.check_move())
+        
+        # Type-ahead suggestions from the puzzle's answer table
+        self.move_hints = ttk.Label(self.puzzle_frame, text="")
+        self.move_hints.pack(padx=5)
         
         # Submit move button
         self.submit_button = ttk.Button(self.puzzle_frame, text="Submit Move", command=self.check_move)
@@ -309,17 +703,20 @@ class ChessPuzzleAlarm:
         volume_frame.pack(fill="x", padx=5, pady=5)
         
         ttk.Label(volume_frame, text="Alarm Volume:").pack(side="left", padx=5)
-        self.volume_scale = ttk.Scale(volume_frame, from_=0, to=100, orient="horizontal")
-        self.volume_scale.set(70)  # Default volume
+        self.volume_scale = ttk.Scale(volume_frame, from_=0, to=100, orient="horizontal", variable=self.volume_var)
         self.volume_scale.pack(side="left", expand=True, fill="x", padx=5)
         
+        # Escalating volume
+        ramp_check = ttk.Checkbutton(sound_frame, text="Start quietly and raise the volume over a minute",
+                                     variable=self.ramp_var)
+        ramp_check.pack(anchor="w", padx=5, pady=5)
+        
         # Other settings
         options_frame = ttk.LabelFrame(parent, text="Options")
         options_frame.pack(fill="x", padx=10, pady=10)
         
-        # Auto-increase difficulty
-        self.auto_increase_var = tk.BooleanVar(value=False)
-        auto_increase_check = ttk.Checkbutton(options_frame, text="Auto-increase difficulty if puzzle not solved quickly", 
+        # Pick puzzles by rating instead of the alarm's difficulty
+        auto_increase_check = ttk.Checkbutton(options_frame, text="Adapt puzzle difficulty to my rating", 
                                              variable=self.auto_increase_var)
         auto_increase_check.pack(anchor="w", padx=5, pady=5)
         
@@ -352,20 +749,15 @@ class ChessPuzzleAlarm:
     
     def change_theme(self, event=None):
         """Change the board theme"""
+        self.ensure_puzzle_tab()
         theme = self.theme_var.get()
         
         if theme == "classic":
-            self.board_canvas.light_color = "#F0D9B5"
-            self.board_canvas.dark_color = "#B58863"
+            self.board_canvas.set_colors("#F0D9B5", "#B58863")
         elif theme == "blue":
-            self.board_canvas.light_color = "#DEE3E6"
-            self.board_canvas.dark_color = "#8CA2AD"
+            self.board_canvas.set_colors("#DEE3E6", "#8CA2AD")
         elif theme == "green":
-            self.board_canvas.light_color = "#EEEED2"
-            self.board_canvas.dark_color = "#769656"
-        
-        # Redraw the board
-        self.board_canvas.draw_board()
+            self.board_canvas.set_colors("#EEEED2", "#769656")
     
     def set_alarm(self):
         try:
@@ -381,8 +773,18 @@ class ChessPuzzleAlarm:
             now = datetime.datetime.now()
             alarm_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
             
-            # If the time is in the past, set it for tomorrow
-            if alarm_time <= now:
+            # Recurring alarms start at their first occurrence; otherwise,
+            # if the time is in the past, set it for tomorrow
+            repeat = self.repeat_var.get().strip()
+            if repeat and repeat != "never":
+                from alarm_recurrence import first_occurrence
+                try:
+                    alarm_time = first_occurrence(repeat, alarm_time, now)
+                except ValueError as e:
+                    messagebox.showerror("Invalid Repeat", f"{e}\n\nTry daily, weekdays, mon,wed,fri, "
+                                         "every 3 days or cron 30 7 * * 1-5.")
+                    return
+            elif alarm_time <= now:
                 alarm_time += datetime.timedelta(days=1)
             
             # Add to alarms list
@@ -390,106 +792,341 @@ class ChessPuzzleAlarm:
                 "time": alarm_time,
                 "difficulty": difficulty
             }
+            if repeat and repeat != "never":
+                alarm_info["repeat"] = repeat
+            if self.daemon is not None and self.auto_increase_var.get():
+                # The daemon picks the puzzle, so it needs to know up front
+                alarm_info["adaptive"] = True
             
-            self.alarms.append(alarm_info)
-            self.update_alarms_list()
-            
-            messagebox.showinfo("Alarm Set", f"Alarm set for {alarm_time.strftime('%H:%M')}")
+            if self.add_alarms([alarm_info]):
+                messagebox.showinfo("Alarm Set", f"Alarm set for {alarm_time.strftime('%a %d %b %H:%M')}")
             
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for hour and minute.")
     
+    def restore_alarms(self, missed_policy):
+        """Reload persisted alarms and deal with the ones missed while closed
+
+        If the alarms are locked by another process, this window becomes a
+        client of the alarm daemon instead. Without either, the alarm
+        controls are disabled rather than left to fail on every change.
+        """
+        service = AlarmService(
+            on_fire=self.check_alarms, on_added=self.alarms_added, on_removed=self.alarms_removed,
+            on_rescheduled=lambda alarm: self.ui.post_coalesced(
+                ("rescheduled", alarm["id"]), self.alarms_added, [alarm]
+            )
+        )
+        try:
+            service.restore(missed_policy)
+        except JournalLockedError as e:
+            if self.connect_daemon(self.daemon_socket, report=False):
+                return
+            self.set_alarm_controls(False)
+            messagebox.showerror("Alarms", f"{e}\n\nAlarms cannot be set or deleted in this window.")
+            return
+        except (OSError, ValueError, KeyError) as e:
+            service.stop()
+            self.set_alarm_controls(False)
+            messagebox.showerror("Alarms", f"Could not restore saved alarms: {e}\n\n"
+                                 "Alarms cannot be set or deleted in this window.")
+            return
+        self.alarm_service = service
+        self.set_alarm_controls(True)
+        # Missed alarms fire as soon as the scheduler is running
+        self.alarm_service.start()
+    
+    def connect_daemon(self, socket_path, report=True):
+        """Keep alarms through the alarm daemon, returns False if it cannot be reached"""
+        from alarm_daemon import DaemonClient, DaemonError
+        try:
+            self.daemon = DaemonClient(socket_path, on_event=lambda event: self.ui.post(self.on_daemon_event, event))
+            # Subscribe first so no change falls between the two requests
+            self.daemon.subscribe()
+            self.alarms_added(self.daemon.list_alarms())
+        except (OSError, DaemonError) as e:
+            if self.daemon is not None:
+                self.daemon.close()
+                self.daemon = None
+            if report:
+                messagebox.showerror("Alarm Daemon", f"Could not connect to the alarm daemon: {e}\n\n"
+                                     "Alarms will be kept by this window instead.")
+            return False
+        self.set_alarm_controls(True)
+        return True
+    
+    def set_alarm_controls(self, enabled):
+        state = "normal" if enabled else "disabled"
+        self.set_button.config(state=state)
+        self.delete_button.config(state=state)
+    
+    def on_daemon_event(self, event):
+        kind = event["event"]
+        if kind == "alarms_added":
+            self.alarms_added([decode_alarm(record) for record in event["alarms"]])
+        elif kind == "alarms_deleted":
+            self.alarms_removed(event["ids"])
+        elif kind == "alarm_fired":
+            self.fire_alarm(decode_alarm(event["alarm"]), event.get("session"), event.get("puzzle"))
+        elif kind == "alarm_rescheduled":
+            self.alarms_added([decode_alarm(event["alarm"])])
+        elif kind == "alarm_dismissed":
+            # Solved from another client
+            if self.alarm_active and self.current_alarm and self.current_alarm["id"] == event["alarm"]:
+                self.alarm_active = False
+                self.stop_alarm_sound()
+                self.hide_alarm_banner()
+                self.submit_button.config(state="disabled")
+                self.move_hints.config(text="The alarm was turned off from another client.")
+        elif kind == "disconnected" and self.daemon is not None:
+            # The daemon's alarms are listed again by whoever keeps them now:
+            # this window if the daemon has exited, or a new connection to it
+            self.daemon = None
+            self.alarms_removed(list(self.alarms))
+            self.restore_alarms(self.missed_alarm_policy)
+            if self.alarm_service is not None:
+                messagebox.showwarning("Alarm Daemon", "Lost the connection to the alarm daemon. "
+                                       "Alarms are kept by this window again.")
+    
+    def add_alarms(self, alarms):
+        """Schedule alarms, returns False if the daemon refused them"""
+        if self.daemon is None:
+            self.alarm_service.add_alarms(alarms)
+            return True
+        from alarm_daemon import DaemonError
+        try:
+            # The list is updated by the daemon's alarms_added event
+            self.daemon.add_alarms(alarms)
+        except DaemonError as e:
+            messagebox.showerror("Alarms", f"The alarm daemon could not add the alarm: {e}")
+            return False
+        return True
+    
+    def alarms_added(self, alarms):
+        # A known id is a recurring alarm that moved to its next occurrence
+        for alarm in alarms:
+            previous = self.alarms.get(alarm["id"])
+            if previous is not None:
+                if previous["time"] == alarm["time"]:
+                    continue
+                self.alarms_view.remove(previous)
+            self.alarms[alarm["id"]] = alarm
+            self.alarms_view.insert(alarm)
+            self.schedule_prefetch(alarm)
+    
+    def alarms_removed(self, alarm_ids):
+        for alarm_id in alarm_ids:
+            alarm = self.alarms.pop(alarm_id, None)
+            if alarm is not None:
+                self.alarms_view.remove(alarm)
+            self.cancel_prefetch(alarm_id)
+    
+    def schedule_prefetch(self, alarm):
+        # With the daemon, the puzzle is only chosen when the alarm fires
+        if self.daemon is not None or self.prefetch_lead <= 0:
+            return
+        self.cancel_prefetch(alarm["id"])
+        lead = datetime.timedelta(seconds=self.prefetch_lead)
+        self.prefetch_scheduler.add({"id": alarm["id"], "time": alarm["time"] - lead})
+    
+    def cancel_prefetch(self, alarm_id):
+        self.prefetch_scheduler.remove(alarm_id)
+        self.prefetched.pop(alarm_id, None)
+    
+    def start_prefetch(self, alarm_id):
+        alarm = self.alarms.get(alarm_id)
+        if alarm is None:
+            return
+        future = self.prefetch_pool.submit(self.prefetch_puzzle, alarm["difficulty"], self.auto_increase_var.get())
+        future.add_done_callback(lambda done: self.ui.post(self.stage_puzzle, alarm, done))
+    
+    def stage_puzzle(self, alarm, future):
+        """Keep a prefetched puzzle for its alarm and render its pieces"""
+        try:
+            prepared = future.result()
+        except Exception:
+            # The alarm picks its puzzle when it rings instead
+            metrics.ALARM_PREFETCH_FAILURES.inc()
+            return
+        # Dropped if the alarm was deleted, moved or has already fired
+        if prepared is None or self.alarms.get(alarm["id"]) is not alarm:
+            return
+        self.prefetched[alarm["id"]] = prepared
+        self.ensure_puzzle_tab()
+        self.board_canvas.prerender(prepared["board"])
+    
     def update_alarms_list(self):
-        self.alarms_listbox.delete(0, tk.END)
-        for alarm in self.alarms:
-            self.alarms_listbox.insert(tk.END, f"{alarm['time'].strftime('%H:%M')} - {alarm['difficulty']}")
+        self.alarms_view.render()
     
     def delete_alarm(self):
-        selected = self.alarms_listbox.curselection()
-        if selected:
-            index = selected[0]
-            del self.alarms[index]
-            self.update_alarms_list()
-    
-    def check_alarms(self):
-        while True:
-            now = datetime.datetime.now()
-            current_time = now.replace(second=0, microsecond=0)
-            
-            for alarm in self.alarms[:]:  # Make a copy to avoid modification issues
-                if alarm["time"] <= now:
-                    self.current_alarm = alarm
-                    self.trigger_alarm(alarm)
-                    self.alarms.remove(alarm)
-                    self.update_alarms_list()
-            
-            time.sleep(15)  # Check every 15 seconds
+        alarm_id = self.alarms_view.selected_id()
+        if alarm_id is None:
+            return
+        if self.daemon is None:
+            self.alarm_service.delete_alarms([alarm_id])
+            return
+        from alarm_daemon import DaemonError
+        try:
+            self.daemon.delete_alarms([alarm_id])
+        except DaemonError as e:
+            messagebox.showerror("Alarms", f"The alarm daemon could not delete the alarm: {e}")
+    
+    def check_alarms(self, alarm):
+        # Called on the scheduler thread when an alarm is due; Tk work has
+        # to happen on the main loop
+        self.ui.post(self.fire_alarm, alarm)
+    
+    def fire_alarm(self, alarm, session_id=None, puzzle=None):
+        self.current_alarm = alarm
+        listed = self.alarms.get(alarm["id"])
+        # Unless it repeats and its next occurrence is already listed
+        if listed is not None and listed["time"] == alarm["time"]:
+            del self.alarms[alarm["id"]]
+            # Many alarms firing together only refresh the list once
+            self.alarms_view.remove(alarm)
+        self.trigger_alarm(alarm, session_id, puzzle)
     
-    def trigger_alarm(self, alarm):
-        # This would play a sound in a real implementation
-        # For now, we'll just show a message and display a puzzle
+    def trigger_alarm(self, alarm, session_id=None, puzzle=None):
+        started = time.perf_counter()
         self.root.bell()  # Built-in bell sound
         
         # Show alarm notification
         self.alarm_active = True
+        self.alarm_banner.config(text="Time to wake up! Solve the chess puzzle to stop the alarm.", bg="#C62828")
+        self.alarm_banner.pack(fill="x", before=self.notebook)
         
         # Bring window to front
         self.root.attributes('-topmost', True)
         self.root.attributes('-topmost', False)
         self.root.deiconify()  # Restore if minimized
         
-        messagebox.showinfo("Alarm", "Time to wake up! Solve the chess puzzle to stop the alarm.")
+        # The puzzle prepared ahead of time, the one the daemon opened, or
+        # failing both one picked now based on difficulty
+        prepared = self.prefetched.pop(alarm["id"], None)
+        self.cancel_prefetch(alarm["id"])
+        if session_id is not None:
+            prepared = self.prepare_puzzle(puzzle, session_id)
+        elif prepared is not None:
+            metrics.ALARM_PUZZLES_PREFETCHED.inc()
+        else:
+            prepared = self.prefetch_puzzle(alarm["difficulty"], self.auto_increase_var.get())
+        if prepared is not None:
+            self.display_puzzle(prepared)
+        else:
+            self.load_puzzle(alarm["difficulty"])
+        self.notebook.select(self.puzzle_tab)
+        self.move_entry.focus_set()
         
-        # Load a puzzle based on difficulty
-        self.load_puzzle(alarm["difficulty"])
-        
-        # Start the alarm sound in a separate thread (simulated)
-        self.alarm_thread = threading.Thread(target=self.play_alarm_sound, daemon=True)
-        self.alarm_thread.start()
+        # Start the alarm sound together with the puzzle, unless an earlier
+        # alarm is still ringing
+        self.play_alarm_sound()
+        self.root.update_idletasks()
+        metrics.ALARM_TRIGGER.observe(time.perf_counter() - started)
+    
+    def hide_alarm_banner(self):
+        if not self.alarm_active:
+            self.alarm_banner.pack_forget()
     
     def play_alarm_sound(self):
-        # In a real implementation, this would play an actual sound file
-        # For demonstration purposes, we'll just print to console and use the system bell
-        while self.alarm_active:
-            print("ALARM SOUND PLAYING")
-            self.root.bell()
-            time.sleep(3)  # Bell sound every 3 seconds
+        if self.alarm_player is not None and self.alarm_player.is_playing():
+            return
+        self.alarm_player = AlarmPlayer(
+            self.sink_factory(),
+            volume=self.volume_var.get() / 100,
+            ramp_seconds=ALARM_RAMP_SECONDS if self.ramp_var.get() else 0.0
+        ).start()
     
-    def load_puzzle(self, difficulty):
-        # Filter puzzles by difficulty
-        suitable_puzzles = [p for p in self.puzzles if p["difficulty"] == difficulty]
+    def stop_alarm_sound(self):
+        if self.alarm_player is not None:
+            self.alarm_player.stop()
+            self.alarm_player = None
+    
+    def pick_puzzle(self, difficulty, adaptive):
+        # Puzzles don't repeat until every puzzle of the difficulty has been seen
+        self.get_puzzle_store()
+        if adaptive:
+            puzzle = self.puzzle_selector.next_adaptive()
+        else:
+            puzzle = self.puzzle_selector.next_puzzle(difficulty)
         
-        if not suitable_puzzles:
+        if puzzle is None:
             # If no puzzles match the difficulty, use any puzzle
-            suitable_puzzles = self.puzzles
-        
-        # Select a random puzzle
-        self.current_puzzle = random.choice(suitable_puzzles)
-        
-        # Set up the chess board
-        self.board = chess.Board(self.current_puzzle["fen"])
-        self.expected_move = self.current_puzzle["solution"]
-        
-        # Update the UI
-        self.puzzle_description.config(text=self.current_puzzle["description"])
-        self.submit_button.config(state="normal")
-        self.move_entry.delete(0, tk.END)
+            puzzle = self.puzzle_selector.next_puzzle()
+        return puzzle
+    
+    def load_puzzle(self, difficulty):
+        self.show_puzzle(self.pick_puzzle(difficulty, self.auto_increase_var.get()))
+    
+    def prefetch_puzzle(self, difficulty, adaptive):
+        """Pick and prepare a playable alarm puzzle, or None; touches no widgets
         
-        # Show the board
-        self.update_board_display()
+        A puzzle whose solution line cannot be played out in full would
+        leave the alarm ringing, so it is passed over.
+        """
+        from puzzle_verify import line_problem
+        for _ in range(PREFETCH_ATTEMPTS):
+            puzzle = self.pick_puzzle(difficulty, adaptive)
+            if puzzle is None:
+                return None
+            try:
+                prepared = self.prepare_puzzle(puzzle)
+            except ValueError:
+                continue
+            board = prepared["board"]
+            if board.is_valid() and line_problem(board, puzzle["solution"]) is None:
+                return prepared
+        return None
     
     def load_random_puzzle(self):
-        # Select a random puzzle for practice
-        self.current_puzzle = random.choice(self.puzzles)
+        # Select a puzzle for practice
+        self.get_puzzle_store()
+        self.show_puzzle(self.puzzle_selector.next_puzzle())
+    
+    def prepare_puzzle(self, puzzle, session_id=None):
+        """Board, answer table and session for a puzzle; safe off the main thread
         
-        # Set up the chess board
-        self.board = chess.Board(self.current_puzzle["fen"])
-        self.expected_move = self.current_puzzle["solution"]
+        With a daemon session id, the daemon judges the moves.
+        """
+        import chess
+        from answer_table import AnswerTable
+        from puzzle_solver import PuzzleSession, Solver
+        
+        # Set up the chess board and every accepted spelling of its legal moves
+        board = chess.Board(puzzle["fen"])
+        if session_id is not None:
+            from alarm_daemon import RemoteSession
+            session = RemoteSession(self.daemon, session_id, board)
+        else:
+            try:
+                session = PuzzleSession(board, puzzle, Solver(SOLVER_NODE_LIMIT))
+            except ValueError:
+                session = None
+        return {
+            "puzzle": puzzle,
+            "board": board,
+            "answers": AnswerTable(board),
+            "session": session,
+            "remote": session_id is not None
+        }
+    
+    def show_puzzle(self, puzzle, session_id=None):
+        self.display_puzzle(self.prepare_puzzle(puzzle, session_id))
+    
+    def display_puzzle(self, prepared):
+        self.ensure_puzzle_tab()
+        self.current_puzzle = prepared["puzzle"]
+        self.board = prepared["board"]
+        self.answers = prepared["answers"]
+        self.session = prepared["session"]
+        self.remote_session = prepared["remote"]
         
         # Update the UI
         self.puzzle_description.config(text=self.current_puzzle["description"])
         self.submit_button.config(state="normal")
         self.move_entry.delete(0, tk.END)
+        self.move_hints.config(text="")
+        self.puzzle_shown_at = time.perf_counter()
+        self.attempts = 0
         
         # Show the board
         self.update_board_display()
@@ -498,56 +1135,121 @@ class ChessPuzzleAlarm:
         # Update board canvas with current position
         self.board_canvas.update_board(self.board)
     
+    def update_move_hints(self, event=None):
+        if self.answers is None or str(self.submit_button.cget("state")) == "disabled":
+            return
+        matches = self.answers.completions(self.move_entry.get())
+        self.move_hints.config(text="  ".join(matches))
+    
+    def complete_move(self, event=None):
+        # Tab fills in the move when only one legal move matches
+        if self.answers is not None:
+            matches = self.answers.completions(self.move_entry.get())
+            if len(matches) == 1:
+                self.move_entry.delete(0, tk.END)
+                self.move_entry.insert(0, matches[0])
+        return "break"
+    
     def check_move(self):
-        user_move = self.move_entry.get().strip().lower()
+        from answer_table import AnswerTable
+        if self.answers is None or str(self.submit_button.cget("state")) == "disabled":
+            return
+        user_move = self.move_entry.get().strip()
         
-        # Convert user input to chess move
-        try:
-            # Handle move in different formats
-            if len(user_move) == 4:
-                # Format: e2e4
-                move = chess.Move.from_uci(user_move)
-            elif len(user_move) == 5 and user_move[2] == 'x':
-                # Format: e2xe4 (capture)
-                move = chess.Move.from_uci(user_move[0] + user_move[1] + user_move[3] + user_move[4])
+        # Every accepted spelling of every legal move was computed with the puzzle
+        move = self.answers.lookup(user_move)
+        if move is None:
+            if self.answers.is_ambiguous(user_move):
+                messagebox.showerror("Ambiguous Move", "That could be more than one move. Use a capital letter for pieces (e.g. Bxc3) or e2e4 notation.")
             else:
-                # Try to parse as SAN (e.g., Nf3)
-                move = self.board.parse_san(user_move)
-            
-            # Check if move is legal
-            if move not in self.board.legal_moves:
-                messagebox.showerror("Invalid Move", "That move is not legal in this position.")
-                return
-            
-            # Check if move matches expected solution
-            expected_move = chess.Move.from_uci(self.expected_move)
+                messagebox.showerror("Invalid Move", "That move is not legal in this position. Enter it like e2e4 or Nf3.")
+            return
+        
+        # No session means the solution could not be read when the puzzle was shown
+        if self.session is None:
+            messagebox.showerror("Invalid Puzzle", f"This puzzle's solution {self.current_puzzle.get('solution')!r} is not a valid move.")
+            return
+        
+        try:
+            # The solution line, or any other move that keeps the win
+            status, reply = self.session.submit(move)
             
-            if move == expected_move:
+            if status == "continue":
+                # The opponent's reply has been played, the puzzle goes on
+                self.update_board_display()
+                self.answers = AnswerTable(self.board)
+                self.move_entry.delete(0, tk.END)
+                self.move_hints.config(text=f"{reply} was played. Your move.")
+            elif status == "solved":
                 # Correct move
-                self.board.push(move)
+                elapsed = time.perf_counter() - self.puzzle_shown_at
+                metrics.PUZZLE_SOLVE.observe(elapsed)
+                attempts = self.attempts + 1
+                metrics.PUZZLE_ATTEMPTS.observe(attempts)
+                metrics.PUZZLES_SOLVED.inc()
+                if self.remote_session:
+                    # The daemon has already recorded the result
+                    rating = self.session.rating
+                else:
+                    rating = self.puzzle_selector.record_result(self.current_puzzle, elapsed, attempts)
                 self.update_board_display()
+                self.move_hints.config(text="")
                 
                 # If this was from an alarm, turn it off
                 if self.alarm_active:
                     self.alarm_active = False
+                    self.stop_alarm_sound()
+                    self.hide_alarm_banner()
                     messagebox.showinfo("Alarm Stopped", "Great job! The alarm has been turned off.")
                     self.submit_button.config(state="disabled")
                 else:
-                    messagebox.showinfo("Correct", "That's the correct move! Puzzle solved.")
+                    messagebox.showinfo("Correct", f"That's the correct move! Puzzle solved.\n\nYour puzzle rating is now {rating:.0f}.")
                     self.submit_button.config(state="disabled")
             else:
                 # Wrong move
+                self.attempts += 1
+                metrics.WRONG_MOVES.inc()
                 messagebox.showerror("Wrong Move", "That's not the best move for this position. Try again!")
                 
-        except ValueError:
-            messagebox.showerror("Invalid Input", "Please enter a valid chess move (e.g., e2e4 or Nf3).")
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Chess Puzzle Alarm Clock")
+    parser.add_argument("--missed-alarms", choices=MISSED_POLICIES, default="fire",
+                        help="what to do with alarms that passed while the app was closed")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print a startup time breakdown once the first frame is drawn")
+    parser.add_argument("--audio-sink", choices=("auto", "aplay", "bell", "wav", "null"), default="auto",
+                        help="where the alarm tone goes (default: aplay if available, else the system bell)")
+    parser.add_argument("--audio-wav", default="alarm.wav", help="output file for --audio-sink wav")
+    parser.add_argument("--prefetch-lead", type=float, default=PREFETCH_LEAD_SECONDS,
+                        help="seconds before an alarm to prepare its puzzle, 0 to pick it when it rings (default: 60)")
+    parser.add_argument("--daemon", nargs="?", const="", default=None, metavar="SOCKET",
+                        help="use the alarm daemon for alarms (default socket if no path is given)")
+    parser.add_argument("--metrics-file", help="periodically export runtime metrics to this file")
+    parser.add_argument("--metrics-format", choices=("jsonl", "prometheus"), default="jsonl",
+                        help="metrics file format (default: jsonl)")
+    parser.add_argument("--metrics-interval", type=float, default=60.0,
+                        help="seconds between metrics exports (default: 60)")
+    args = parser.parse_args()
+    
+    profiler = StartupProfiler(enabled=args.profile_startup)
+    profiler.mark("modules imported")
     root = tk.Tk()
-    app = ChessPuzzleAlarm(root)
+    profiler.mark("Tk initialized")
+    app = ChessPuzzleAlarm(root, missed_alarm_policy=args.missed_alarms, profiler=profiler,
+                           audio_sink=args.audio_sink, audio_wav=args.audio_wav, daemon_socket=args.daemon,
+                           prefetch_lead=args.prefetch_lead)
+    profiler.watch_first_frame(root)
+    
+    exporter = None
+    if args.metrics_file:
+        exporter = metrics.MetricsExporter(args.metrics_file, args.metrics_format, args.metrics_interval)
+        exporter.start()
     root.mainloop()
+    if exporter:
+        exporter.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,224 @@
+import array
+import math
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+SAMPLE_RATE = 22050
+PERIOD_FRAMES = 1024          # one buffer period, about 46 ms
+VOLUME_STEPS = 20             # ramps move through this many cached levels
+
+# Alarm pattern: two 880 Hz beeps then a pause, repeated
+TONE_PATTERN = ((880.0, 0.18), (None, 0.12), (880.0, 0.18), (None, 0.72))
+
+
+def synthesize_tone(volume, sample_rate=SAMPLE_RATE, pattern=TONE_PATTERN):
+    """One cycle of the alarm tone as 16-bit mono PCM at volume 0.0-1.0
+
+    The length is padded to a whole number of buffer periods so the cycle
+    can be looped a period at a time.
+    """
+    samples = array.array("h")
+    amplitude = 32767 * max(0.0, min(1.0, volume))
+    fade = int(sample_rate * 0.005)  # 5 ms edges to avoid clicks
+    for frequency, seconds in pattern:
+        frames = int(sample_rate * seconds)
+        if frequency is None:
+            samples.extend([0] * frames)
+            continue
+        step = 2 * math.pi * frequency / sample_rate
+        for i in range(frames):
+            envelope = min(1.0, i / fade, (frames - i) / fade)
+            samples.append(int(amplitude * envelope * math.sin(step * i)))
+    remainder = len(samples) % PERIOD_FRAMES
+    if remainder:
+        samples.extend([0] * (PERIOD_FRAMES - remainder))
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+class ToneCache:
+    """Pre-rendered tone buffers, one per quantized volume level"""
+
+    def __init__(self, steps=VOLUME_STEPS):
+        self.steps = steps
+        self.lock = threading.Lock()
+        self.buffers = {}
+
+    def level(self, volume):
+        return max(0, min(self.steps, round(volume * self.steps)))
+
+    def get(self, volume):
+        level = self.level(volume)
+        with self.lock:
+            buffer = self.buffers.get(level)
+            if buffer is None:
+                buffer = self.buffers[level] = memoryview(synthesize_tone(level / self.steps))
+        return buffer
+
+
+TONES = ToneCache()
+
+
+class NullSink:
+    """Discards audio; the player paces itself in real time"""
+
+    realtime = False
+
+    def write(self, data):
+        pass
+
+    def close(self, abort=False):
+        pass
+
+
+class WavFileSink:
+    """Writes everything that would have been played to a WAV file"""
+
+    realtime = False
+
+    def __init__(self, path):
+        self.file = wave.open(path, "wb")
+        self.file.setnchannels(1)
+        self.file.setsampwidth(2)
+        self.file.setframerate(SAMPLE_RATE)
+
+    def write(self, data):
+        self.file.writeframesraw(data)
+
+    def close(self, abort=False):
+        self.file.close()
+
+
+class AplaySink:
+    """Streams raw PCM to ALSA's aplay, which blocks at playback speed"""
+
+    realtime = True
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-c", "1", "-r", str(SAMPLE_RATE),
+             "--buffer-size", str(PERIOD_FRAMES * 4)],
+            stdin=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def close(self, abort=False):
+        if abort:
+            # Drop whatever is still buffered instead of letting it play out
+            self.process.kill()
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.wait()
+
+
+class BellSink:
+    """Fallback without an audio device: rings a bell once per tone cycle"""
+
+    realtime = False
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def write(self, data):
+        pass
+
+    def cycle_started(self):
+        self.ring()
+
+    def close(self, abort=False):
+        pass
+
+
+def default_sink_factory(name="auto", wav_path="alarm.wav", ring=None):
+    """Returns a callable creating the named sink for each alarm"""
+    if name == "auto":
+        name = "aplay" if shutil.which("aplay") else "bell"
+    if name == "aplay":
+        return AplaySink
+    if name == "wav":
+        return lambda: WavFileSink(wav_path)
+    if name == "bell" and ring is not None:
+        return lambda: BellSink(ring)
+    return NullSink
+
+
+class AlarmPlayer:
+    """Loops the cached alarm tone into a sink one buffer period at a time
+
+    The tone buffer works as a ring: playback reads consecutive periods
+    from it and wraps at the end, slicing memoryviews so nothing is
+    allocated per period. stop() takes effect at the next period boundary.
+    With ramp_seconds the volume rises from ramp_start of the target to the
+    full target level, switching between pre-rendered volume levels.
+    """
+
+    def __init__(self, sink, volume=0.7, ramp_seconds=0.0, ramp_start=0.2, tones=TONES):
+        self.sink = sink
+        self.volume = volume
+        self.ramp_seconds = ramp_seconds
+        self.ramp_start = ramp_start
+        self.tones = tones
+        self.stopped = threading.Event()
+        self.thread = None
+        self.period_seconds = PERIOD_FRAMES / SAMPLE_RATE
+        self.periods_played = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def is_playing(self):
+        return self.thread is not None and self.thread.is_alive() and not self.stopped.is_set()
+
+    def current_volume(self, elapsed):
+        if self.ramp_seconds <= 0 or elapsed >= self.ramp_seconds:
+            return self.volume
+        fraction = self.ramp_start + (1 - self.ramp_start) * elapsed / self.ramp_seconds
+        return self.volume * fraction
+
+    def run(self):
+        bytes_per_period = PERIOD_FRAMES * 2
+        position = 0
+        started = time.perf_counter()
+        next_deadline = started
+        try:
+            while not self.stopped.is_set():
+                elapsed = time.perf_counter() - started
+                tone = self.tones.get(self.current_volume(elapsed))
+                if position >= len(tone):
+                    position = 0
+                if position == 0 and hasattr(self.sink, "cycle_started"):
+                    self.sink.cycle_started()
+
+                try:
+                    self.sink.write(tone[position:position + bytes_per_period])
+                except OSError as e:
+                    print(f"Alarm audio output failed: {e}", file=sys.stderr)
+                    break
+                position += bytes_per_period
+                self.periods_played += 1
+
+                if not self.sink.realtime:
+                    next_deadline += self.period_seconds
+                    delay = next_deadline - time.perf_counter()
+                    if delay > 0:
+                        self.stopped.wait(delay)
+        finally:
+            self.sink.close(abort=self.stopped.is_set())
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self, timeout=None):
+        if self.thread:
+            self.thread.join(timeout)
@@ -0,0 +1,612 @@
+"""Headless alarm daemon
+
+Runs the alarm scheduler and the puzzle core without a display and serves
+them over a Unix domain socket, so alarms fire with no window open and can
+be managed in bulk from scripts. The Tk app becomes a client with
+--daemon.
+
+The protocol is newline-delimited JSON. A request is an object with an
+"op" and an optional "id" that is echoed back in the response:
+
+    {"id": 1, "op": "add_alarms", "alarms": [{"time": "2025-01-01T07:00:00", "difficulty": "easy"}]}
+    {"id": 1, "ok": true, "result": {"ids": [12]}}
+
+Failures come back as {"id": 1, "ok": false, "error": "..."}. A client that
+sends "subscribe" also receives event objects, which carry an "event" key
+instead of an "id": alarms_added, alarms_deleted, alarm_fired (with a
+puzzle session opened for the alarm), alarm_rescheduled (a recurring alarm
+moved to its next occurrence) and alarm_dismissed.
+
+    python alarm_daemon.py serve
+    python alarm_daemon.py add 2025-01-01T07:00 2025-01-02T07:00 --difficulty hard
+    python alarm_daemon.py add 2025-01-01T07:00 --repeat weekdays
+    python alarm_daemon.py add --file alarms.jsonl
+    python alarm_daemon.py list
+    python alarm_daemon.py delete 3 4 5
+    python alarm_daemon.py watch
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import itertools
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from alarm_recurrence import first_occurrence
+from alarm_service import AlarmService
+from alarm_store import encode_alarm, decode_alarm, MISSED_POLICIES
+
+PROTOCOL_VERSION = 1
+
+# Longest request line, enough for bulk requests of MAX_BULK alarms
+MAX_LINE = 4 * 1024 * 1024
+MAX_BULK = 10000
+# Subscribers that fall this far behind on events are disconnected
+MAX_CLIENT_BUFFER = 1024 * 1024
+
+DIFFICULTIES = ("easy", "medium", "hard")
+SOLVER_NODE_LIMIT = 20000
+# Sessions nobody has touched for this long are dropped
+SESSION_TTL = 6 * 3600
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "chess-puzzle-alarm.sock")
+    return os.path.join(tempfile.gettempdir(), f"chess-puzzle-alarm-{os.getuid()}.sock")
+
+
+class RequestError(Exception):
+    pass
+
+
+def public_puzzle(puzzle):
+    """A puzzle as sent to clients, without its solution"""
+    keys = ("id", "fen", "description", "difficulty", "themes", "rating")
+    return {key: puzzle[key] for key in keys if key in puzzle}
+
+
+def parse_alarm(record):
+    if not isinstance(record, dict):
+        raise RequestError("each alarm must be an object")
+    try:
+        alarm_time = datetime.datetime.fromisoformat(record["time"])
+    except (KeyError, TypeError, ValueError):
+        raise RequestError(f"alarm time must be an ISO date and time, got {record.get('time')!r}")
+    if alarm_time.tzinfo is not None:
+        # The scheduler works in naive local time
+        alarm_time = alarm_time.astimezone().replace(tzinfo=None)
+
+    difficulty = record.get("difficulty", "medium")
+    if difficulty not in DIFFICULTIES:
+        raise RequestError(f"difficulty must be one of {', '.join(DIFFICULTIES)}")
+    alarm = {"time": alarm_time, "difficulty": difficulty}
+    if record.get("repeat"):
+        # A recurring alarm starts at the rule's first occurrence from time on
+        try:
+            alarm["time"] = first_occurrence(record["repeat"], alarm_time, datetime.datetime.now())
+        except (TypeError, ValueError) as e:
+            raise RequestError(f"bad repeat rule: {e}")
+        alarm["repeat"] = record["repeat"]
+    if record.get("label") is not None:
+        alarm["label"] = str(record["label"])
+    if record.get("adaptive"):
+        alarm["adaptive"] = True
+    return alarm
+
+
+def require_list(request, key):
+    values = request.get(key)
+    if not isinstance(values, list):
+        raise RequestError(f"{key!r} must be a list")
+    if len(values) > MAX_BULK:
+        raise RequestError(f"at most {MAX_BULK} {key} per request")
+    return values
+
+
+class DaemonSession:
+    """A puzzle being solved through the API; one client at a time may submit"""
+
+    def __init__(self, session_id, puzzle, alarm_id=None):
+        import chess
+        from answer_table import AnswerTable
+        from puzzle_solver import PuzzleSession, Solver
+        self.id = session_id
+        self.puzzle = puzzle
+        self.alarm_id = alarm_id
+        self.board = chess.Board(puzzle["fen"])
+        self.answers = AnswerTable(self.board)
+        self.session = PuzzleSession(self.board, puzzle, Solver(SOLVER_NODE_LIMIT))
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.last_used = time.monotonic()
+        self.wrong_moves = 0
+
+    def describe(self):
+        return {
+            "session": self.id,
+            "alarm": self.alarm_id,
+            "puzzle": public_puzzle(self.puzzle),
+            "fen": self.board.fen()
+        }
+
+    def submit(self, text):
+        """Judge one move in any accepted spelling; runs on a worker thread"""
+        from answer_table import AnswerTable
+        with self.lock:
+            self.last_used = time.monotonic()
+            move = self.answers.lookup(text)
+            if move is None:
+                return {"status": "ambiguous" if self.answers.is_ambiguous(text) else "illegal"}
+
+            status, reply = self.session.submit(move)
+            result = {"status": status}
+            if status == "wrong":
+                self.wrong_moves += 1
+            elif status == "continue":
+                self.answers = AnswerTable(self.board)
+                result["reply"] = reply
+                result["reply_uci"] = self.board.peek().uci()
+            result["fen"] = self.board.fen()
+            return result
+
+
+class ClientConnection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.subscribed = False
+        self.task = asyncio.current_task()
+
+    def send(self, message):
+        if self.writer.is_closing():
+            return
+        self.writer.write((json.dumps(message) + "\n").encode("utf-8"))
+        if self.writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            print("Disconnecting a client that is not reading its events", file=sys.stderr)
+            self.writer.close()
+
+
+class AlarmDaemon:
+    """Serves the alarm service and puzzle sessions over a Unix socket
+
+    Requests from one client are handled in order; clients are served
+    concurrently. Journal writes, puzzle selection and move checking run
+    on worker threads so the event loop only ever parses and routes JSON.
+    """
+
+    def __init__(self, socket_path=None, missed_policy="fire", db_path=None, alarm_store=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.missed_policy = missed_policy
+        self.db_path = db_path
+        self.alarm_store = alarm_store
+        self.clients = set()
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.loop = None
+        self.stopped = None
+        self.ready = threading.Event()
+
+    def run_in_thread(self, func, *args):
+        return self.loop.run_in_executor(None, functools.partial(func, *args))
+
+    def threadsafe(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+    async def serve(self):
+        from puzzle_rating import PuzzleSelector
+        from puzzle_store import PuzzleStore, DEFAULT_DB_PATH
+
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.service = AlarmService(
+            self.alarm_store,
+            on_fire=lambda alarm: self.threadsafe(self.alarm_fired, alarm),
+            on_added=lambda alarms: self.threadsafe(
+                self.broadcast, "alarms_added", {"alarms": [encode_alarm(alarm) for alarm in alarms]}),
+            on_removed=lambda alarm_ids: self.threadsafe(
+                self.broadcast, "alarms_deleted", {"ids": list(alarm_ids)}),
+            on_rescheduled=lambda alarm: self.threadsafe(
+                self.broadcast, "alarm_rescheduled", {"alarm": encode_alarm(alarm)})
+        )
+        self.puzzle_store = await self.run_in_thread(PuzzleStore, self.db_path or DEFAULT_DB_PATH)
+        self.selector = PuzzleSelector(self.puzzle_store)
+        await self.run_in_thread(self.service.restore, self.missed_policy)
+
+        self.remove_stale_socket()
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path, limit=MAX_LINE)
+        os.chmod(self.socket_path, 0o600)
+        self.service.start()
+        print(f"Alarm daemon listening on {self.socket_path} with {len(self.service.alarms())} alarms", file=sys.stderr)
+        self.ready.set()
+        try:
+            await self.stopped.wait()
+        finally:
+            server.close()
+            # Release the journal lock and the socket before clients hear of
+            # the shutdown, so one that falls back to its own alarms can
+            self.service.stop()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            # Let every connection finish its current request
+            for client in list(self.clients):
+                client.writer.close()
+            await asyncio.gather(*[client.task for client in self.clients], return_exceptions=True)
+            await server.wait_closed()
+            self.puzzle_store.close()
+
+    def remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f"another alarm daemon is listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    def stop(self):
+        """Stop serving; safe to call from any thread"""
+        self.threadsafe(self.stopped.set)
+
+    async def handle_client(self, reader, writer):
+        client = ClientConnection(writer)
+        self.clients.add(client)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    client.send({"id": None, "ok": False, "error": f"request longer than {MAX_LINE} bytes"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                client.send(await self.handle_request(client, line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def handle_request(self, client, line):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError("request is not valid JSON")
+            if not isinstance(request, dict):
+                raise RequestError("request must be a JSON object")
+            request_id = request.get("id")
+            handler = getattr(self, f"op_{request.get('op')}", None)
+            if handler is None:
+                raise RequestError(f"unknown op {request.get('op')!r}")
+            return {"id": request_id, "ok": True, "result": await handler(client, request)}
+        except RequestError as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:
+            print(f"Error handling request {line[:200]!r}: {e!r}", file=sys.stderr)
+            return {"id": request_id, "ok": False, "error": f"internal error: {e}"}
+
+    def broadcast(self, event, payload):
+        message = dict(payload, event=event)
+        for client in list(self.clients):
+            if client.subscribed:
+                client.send(message)
+
+    # Requests
+
+    async def op_ping(self, client, request):
+        return {"version": PROTOCOL_VERSION, "alarms": len(self.service.scheduler), "sessions": len(self.sessions)}
+
+    async def op_subscribe(self, client, request):
+        client.subscribed = True
+        return {}
+
+    async def op_list_alarms(self, client, request):
+        return {"alarms": [encode_alarm(alarm) for alarm in self.service.alarms()]}
+
+    async def op_add_alarms(self, client, request):
+        alarms = [parse_alarm(record) for record in require_list(request, "alarms")]
+        added = await self.run_in_thread(self.service.add_alarms, alarms)
+        return {"ids": [alarm["id"] for alarm in added]}
+
+    async def op_delete_alarms(self, client, request):
+        alarm_ids = require_list(request, "ids")
+        if not all(isinstance(alarm_id, int) for alarm_id in alarm_ids):
+            raise RequestError("alarm ids must be integers")
+        return {"deleted": await self.run_in_thread(self.service.delete_alarms, alarm_ids)}
+
+    async def op_start_session(self, client, request):
+        difficulty = request.get("difficulty")
+        if difficulty is not None and difficulty not in DIFFICULTIES:
+            raise RequestError(f"difficulty must be one of {', '.join(DIFFICULTIES)}")
+        session = await self.new_session(difficulty, bool(request.get("adaptive")))
+        return session.describe()
+
+    async def op_submit_move(self, client, request):
+        session = self.sessions.get(request.get("session"))
+        if session is None:
+            raise RequestError(f"no session {request.get('session')!r}")
+        if not isinstance(request.get("move"), str):
+            raise RequestError("'move' must be a string")
+
+        result = await self.run_in_thread(session.submit, request["move"])
+        if result["status"] == "solved" and self.sessions.pop(session.id, None) is not None:
+            elapsed = time.perf_counter() - session.started
+            result["rating"] = await self.run_in_thread(
+                self.selector.record_result, session.puzzle, elapsed, session.wrong_moves + 1
+            )
+            if session.alarm_id is not None:
+                self.broadcast("alarm_dismissed", {"alarm": session.alarm_id, "session": session.id})
+        return result
+
+    async def op_end_session(self, client, request):
+        return {"ended": self.sessions.pop(request.get("session"), None) is not None}
+
+    async def op_shutdown(self, client, request):
+        self.stopped.set()
+        return {}
+
+    # Puzzles
+
+    def pick_puzzle(self, difficulty, adaptive):
+        puzzle = self.selector.next_adaptive() if adaptive else self.selector.next_puzzle(difficulty)
+        return puzzle or self.selector.next_puzzle()
+
+    async def new_session(self, difficulty, adaptive, alarm_id=None):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_used > SESSION_TTL:
+                del self.sessions[session_id]
+
+        puzzle = await self.run_in_thread(self.pick_puzzle, difficulty, adaptive)
+        if puzzle is None:
+            raise RequestError("the puzzle database is empty")
+        try:
+            session = await self.run_in_thread(DaemonSession, next(self.session_ids), puzzle, alarm_id)
+        except ValueError as e:
+            raise RequestError(f"puzzle {puzzle['id']} is broken: {e}")
+        self.sessions[session.id] = session
+        return session
+
+    def alarm_fired(self, alarm):
+        self.loop.create_task(self.open_alarm_session(alarm))
+
+    async def open_alarm_session(self, alarm):
+        payload = {"alarm": encode_alarm(alarm)}
+        try:
+            session = await self.new_session(alarm.get("difficulty"), alarm.get("adaptive"), alarm["id"])
+            payload.update(session.describe(), alarm=encode_alarm(alarm))
+        except RequestError as e:
+            print(f"No puzzle for alarm {alarm['id']}: {e}", file=sys.stderr)
+        self.broadcast("alarm_fired", payload)
+
+
+class DaemonError(Exception):
+    pass
+
+
+class DaemonClient:
+    """Blocking client for the daemon, safe to share between threads
+
+    Responses are matched to requests by id on a reader thread, which also
+    passes events to on_event(event). A connection lost other than through
+    close() is reported as a "disconnected" event.
+    """
+
+    def __init__(self, socket_path=None, on_event=None, timeout=30.0):
+        self.socket_path = socket_path or default_socket_path()
+        self.on_event = on_event
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.closed = False
+        self.reader = threading.Thread(target=self.read_loop, daemon=True)
+        self.reader.start()
+
+    def request(self, op, **params):
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.closed:
+                raise DaemonError("not connected to the alarm daemon")
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+            self.sock.sendall((json.dumps(dict(params, op=op, id=request_id)) + "\n").encode("utf-8"))
+        try:
+            response = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise DaemonError(f"no answer to {op} within {self.timeout}s")
+        if not response.get("ok"):
+            raise DaemonError(response.get("error"))
+        return response["result"]
+
+    def read_loop(self):
+        try:
+            with self.sock.makefile("rb") as f:
+                for line in f:
+                    message = json.loads(line)
+                    if "event" in message:
+                        if self.on_event:
+                            try:
+                                self.on_event(message)
+                            except Exception as e:
+                                print(f"Error in alarm daemon event handler: {e!r}", file=sys.stderr)
+                        continue
+                    with self.lock:
+                        future = self.pending.pop(message.get("id"), None)
+                    if future:
+                        future.set_result(message)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                lost = not self.closed
+                self.closed = True
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_result({"ok": False, "error": "connection to the alarm daemon was lost"})
+            if lost and self.on_event:
+                self.on_event({"event": "disconnected"})
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def subscribe(self):
+        return self.request("subscribe")
+
+    def list_alarms(self):
+        return [decode_alarm(record) for record in self.request("list_alarms")["alarms"]]
+
+    def add_alarms(self, alarms):
+        """Add alarm dicts with datetime times, returns their new ids"""
+        ids = []
+        for start in range(0, len(alarms), MAX_BULK):
+            batch = [encode_alarm(alarm) for alarm in alarms[start:start + MAX_BULK]]
+            ids.extend(self.request("add_alarms", alarms=batch)["ids"])
+        return ids
+
+    def delete_alarms(self, alarm_ids):
+        deleted = []
+        for start in range(0, len(alarm_ids), MAX_BULK):
+            deleted.extend(self.request("delete_alarms", ids=list(alarm_ids[start:start + MAX_BULK]))["deleted"])
+        return deleted
+
+
+class RemoteSession:
+    """Stands in for a PuzzleSession whose moves are judged by the daemon
+
+    Keeps the local board in step with the daemon's, so the app can draw
+    it and check move spellings locally. rating is set once solved.
+    """
+
+    def __init__(self, client, session_id, board):
+        self.client = client
+        self.session_id = session_id
+        self.board = board
+        self.rating = None
+
+    def submit(self, move):
+        import chess
+        result = self.client.request("submit_move", session=self.session_id, move=move.uci())
+        status = result["status"]
+        if status not in ("continue", "solved"):
+            return "wrong", None
+        self.board.push(move)
+        if result.get("reply_uci"):
+            self.board.push(chess.Move.from_uci(result["reply_uci"]))
+        if status == "solved":
+            self.rating = result.get("rating")
+        return status, result.get("reply")
+
+
+def read_alarm_file(path):
+    alarms = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                alarms.append(json.loads(line))
+    return alarms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess Puzzle Alarm daemon and command line client")
+    parser.add_argument("--socket", default=None, help=f"socket path (default: {default_socket_path()})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the daemon in the foreground")
+    serve.add_argument("--db", default=None, help="puzzle database path")
+    serve.add_argument("--missed-alarms", choices=MISSED_POLICIES, default="fire",
+                       help="what to do with alarms that passed while the daemon was not running")
+
+    commands.add_parser("list", help="print scheduled alarms as JSON lines")
+
+    add = commands.add_parser("add", help="add alarms")
+    add.add_argument("times", nargs="*", help="ISO date and times, e.g. 2025-01-01T07:00")
+    add.add_argument("--difficulty", choices=DIFFICULTIES, default="medium")
+    add.add_argument("--label")
+    add.add_argument("--repeat", help="repeat rule: daily, weekdays, weekends, mon,wed,fri, 'every 3 days' "
+                                      "or 'cron 30 7 * * 1-5'")
+    add.add_argument("--file", help="JSON-lines file of alarm objects (time, difficulty, label, repeat, adaptive)")
+
+    delete = commands.add_parser("delete", help="delete alarms by id")
+    delete.add_argument("ids", nargs="+", type=int)
+
+    commands.add_parser("watch", help="print events as JSON lines until interrupted")
+    commands.add_parser("shutdown", help="stop the daemon")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        daemon = AlarmDaemon(args.socket, missed_policy=args.missed_alarms, db_path=args.db)
+        try:
+            asyncio.run(daemon.serve())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        on_event = (lambda event: print(json.dumps(event), flush=True)) if args.command == "watch" else None
+        client = DaemonClient(args.socket, on_event=on_event)
+    except OSError as e:
+        print(f"Could not connect to the alarm daemon: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        if args.command == "list":
+            for alarm in client.request("list_alarms")["alarms"]:
+                print(json.dumps(alarm))
+        elif args.command == "add":
+            records = [{"time": value, "difficulty": args.difficulty, "label": args.label, "repeat": args.repeat}
+                       for value in args.times]
+            if args.file:
+                records.extend(read_alarm_file(args.file))
+            ids = []
+            for start in range(0, len(records), MAX_BULK):
+                ids.extend(client.request("add_alarms", alarms=records[start:start + MAX_BULK])["ids"])
+            print(f"Added {len(ids)} alarms: {', '.join(map(str, ids))}")
+        elif args.command == "delete":
+            deleted = client.delete_alarms(args.ids)
+            print(f"Deleted {len(deleted)} alarms")
+        elif args.command == "watch":
+            client.subscribe()
+            client.reader.join()
+        elif args.command == "shutdown":
+            client.request("shutdown")
+    except DaemonError as e:
+        print(f"Alarm daemon: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Repeat rules for recurring alarms
+
+A recurring alarm is one alarm dict with a "repeat" rule string; its "time"
+is always the next occurrence, so the scheduler holds a single entry per
+rule and the journal one record. When the alarm fires, the next occurrence
+is computed from the rule and the alarm is rescheduled under the same id.
+
+Rules:
+
+    daily
+    weekdays, weekends
+    mon,wed,fri             days of the week (mon-fri ranges work too)
+    every 3 days            counted from the alarm's first date
+    cron 30 7 * * 1-5       minute hour day-of-month month day-of-week
+
+All but cron rules ring at the time of day the alarm was set for.
+Occurrences are wall-clock times: a 07:00 alarm stays at 07:00 across
+daylight saving changes. A time skipped by a spring-forward change rings
+at the same offset after the change, and a time that happens twice in the
+autumn rings once.
+"""
+
+import datetime
+import functools
+
+DAY_NAMES = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+MONTH_NAMES = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+# A cron rule that matches nothing (say 30 February) gives up after this long
+MAX_SEARCH_YEARS = 8
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def next_bit(mask, start):
+    """Lowest set bit of mask at or above start, or None"""
+    rest = mask >> start
+    if not rest:
+        return None
+    return start + (rest & -rest).bit_length() - 1
+
+
+def cron_weekday(date):
+    # Cron counts from Sunday, Python from Monday
+    return (date.weekday() + 1) % 7
+
+
+def parse_field(text, low, high, names=()):
+    """A cron field as a bit mask of the values it matches"""
+    mask = 0
+    for part in text.split(","):
+        part, _, step_text = part.partition("/")
+        step = 1
+        if step_text:
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f"bad step in {text!r}")
+            step = int(step_text)
+        if part == "*":
+            first, last = low, high
+        else:
+            bounds = [parse_value(value, low, high, names) for value in part.split("-", 1)]
+            first, last = bounds[0], bounds[-1]
+            # 5/15 means from 5 to the end in steps of 15
+            if step_text and len(bounds) == 1:
+                last = high
+        if first > last:
+            # Day ranges may wrap around the week, as in sat-sun
+            if names is not DAY_NAMES:
+                raise ValueError(f"empty range in {text!r}")
+            last += 7
+        for value in range(first, last + 1, step):
+            mask |= 1 << value % 7 if names is DAY_NAMES else 1 << value
+    return mask
+
+
+def parse_value(text, low, high, names):
+    text = text.lower()
+    if text in names:
+        return names.index(text) + low
+    if not text.isdigit():
+        raise ValueError(f"{text!r} is not a number")
+    value = int(text)
+    # Day of week 7 is Sunday, as in most crons
+    if names is DAY_NAMES and value == 7:
+        value = 0
+    if not low <= value <= high:
+        raise ValueError(f"{value} is outside {low}-{high}")
+    return value
+
+
+def mask_bits(low, high):
+    return ((1 << (high + 1)) - 1) & ~((1 << low) - 1)
+
+
+ALL_MINUTES = mask_bits(0, 59)
+ALL_HOURS = mask_bits(0, 23)
+ALL_DAYS = mask_bits(1, 31)
+ALL_MONTHS = mask_bits(1, 12)
+ALL_WEEKDAYS = mask_bits(0, 6)
+
+
+class CronRule:
+    """Calendar rule kept as one bit mask per field
+
+    minutes and hours are None for rules that ring at the alarm's own time
+    of day. Finding the next match skips whole months and days that cannot
+    match and takes the time of day straight from the masks, so the cost
+    does not depend on how far away the next occurrence is.
+    """
+
+    def __init__(self, minutes, hours, days=ALL_DAYS, months=ALL_MONTHS, weekdays=ALL_WEEKDAYS):
+        self.minutes = minutes
+        self.hours = hours
+        self.days = days
+        self.months = months
+        self.weekdays = weekdays
+        if not (days and months and weekdays):
+            raise ValueError("rule never matches")
+
+    def day_matches(self, date):
+        if not self.months >> date.month & 1:
+            return False
+        day_match = self.days >> date.day & 1
+        weekday_match = self.weekdays >> cron_weekday(date) & 1
+        # As in cron, a rule that restricts both matches either of them
+        if self.days != ALL_DAYS and self.weekdays != ALL_WEEKDAYS:
+            return bool(day_match or weekday_match)
+        return bool(day_match and weekday_match)
+
+    def next_after(self, start, after):
+        """First occurrence after the datetime after; start gives the time of day"""
+        minutes, hours = self.minutes, self.hours
+        if minutes is None:
+            minutes, hours = 1 << start.minute, 1 << start.hour
+
+        after = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        date = after.date()
+        hour, minute = after.hour, after.minute
+        last = date + datetime.timedelta(days=366 * MAX_SEARCH_YEARS)
+        while date <= last:
+            if not self.months >> date.month & 1:
+                # Jump to the first of the next month
+                date = (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+                hour = minute = 0
+                continue
+            if self.day_matches(date):
+                found_hour = next_bit(hours, hour)
+                if found_hour == hour:
+                    found_minute = next_bit(minutes, minute)
+                    if found_minute is None:
+                        found_hour = next_bit(hours, hour + 1)
+                        found_minute = next_bit(minutes, 0)
+                else:
+                    found_minute = next_bit(minutes, 0)
+                if found_hour is not None:
+                    return datetime.datetime.combine(date, datetime.time(found_hour, found_minute))
+            date += ONE_DAY
+            hour = minute = 0
+        return None
+
+
+class IntervalRule:
+    """Every N days at the alarm's time of day, counted from its first date"""
+
+    def __init__(self, days):
+        if days < 1:
+            raise ValueError("the interval must be at least one day")
+        self.days = days
+
+    def next_after(self, start, after):
+        if start > after:
+            return start
+        # Whole intervals in date arithmetic, so the wall-clock time is kept
+        steps = (after.date() - start.date()).days // self.days
+        date = start.date() + datetime.timedelta(days=steps * self.days)
+        occurrence = datetime.datetime.combine(date, start.time())
+        while occurrence <= after:
+            date += datetime.timedelta(days=self.days)
+            occurrence = datetime.datetime.combine(date, start.time())
+        return occurrence
+
+
+SIMPLE_RULES = {
+    "daily": ALL_WEEKDAYS,
+    "weekdays": parse_field("mon-fri", 0, 6, DAY_NAMES),
+    "weekends": parse_field("sat,sun", 0, 6, DAY_NAMES),
+}
+
+
+@functools.lru_cache(maxsize=256)
+def parse_rule(text):
+    """Parse a repeat rule, raises ValueError; equal rules share one object"""
+    words = text.lower().split()
+    if not words:
+        raise ValueError("empty repeat rule")
+    if words[0] == "cron":
+        if len(words) != 6:
+            raise ValueError("a cron rule has five fields: minute hour day-of-month month day-of-week")
+        return CronRule(
+            parse_field(words[1], 0, 59),
+            parse_field(words[2], 0, 23),
+            parse_field(words[3], 1, 31),
+            parse_field(words[4], 1, 12, MONTH_NAMES),
+            parse_field(words[5], 0, 6, DAY_NAMES)
+        )
+    if words[0] == "every":
+        if len(words) == 3 and words[1].isdigit() and words[2] in ("day", "days"):
+            return IntervalRule(int(words[1]))
+        raise ValueError("use 'every N days'")
+    if len(words) == 1 and words[0] in SIMPLE_RULES:
+        return CronRule(None, None, weekdays=SIMPLE_RULES[words[0]])
+    try:
+        return CronRule(None, None, weekdays=parse_field("".join(words), 0, 6, DAY_NAMES))
+    except ValueError:
+        raise ValueError(f"unknown repeat rule {text!r}")
+
+
+def first_occurrence(rule_text, start, now):
+    """The first occurrence at or after start that is still in the future
+
+    Raises ValueError for a bad rule or one that matches no date.
+    """
+    occurrence = parse_rule(rule_text).next_after(start, max(now, start - datetime.timedelta(microseconds=1)))
+    if occurrence is None:
+        raise ValueError(f"{rule_text!r} never matches a date")
+    return occurrence
+
+
+def next_occurrence(alarm, now):
+    """The occurrence after this one for a recurring alarm, or None
+
+    Counts from whichever is later, the alarm's time or now, so a clock
+    that jumped forward (or an alarm missed while the app was closed)
+    rings once instead of once for every occurrence it skipped.
+    """
+    rule_text = alarm.get("repeat")
+    if not rule_text:
+        return None
+    return parse_rule(rule_text).next_after(alarm["time"], max(now, alarm["time"]))
@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import sys
+import threading
+import time
+
+# Upper bound on a single sleep, so a wall clock change (NTP, suspend) is
+# noticed within a minute even when the next alarm is hours away
+MAX_SLEEP = 60.0
+
+
+class AlarmScheduler:
+    """Deadline-driven alarm scheduler
+
+    Alarms are kept in a heap keyed by fire time. The worker thread sleeps
+    until the earliest deadline and is woken early whenever an alarm is added
+    or removed, so alarms fire on time without polling and an empty
+    scheduler never wakes up.
+    """
+
+    def __init__(self, on_fire):
+        self.on_fire = on_fire
+        self.condition = threading.Condition()
+        self.heap = []      # (timestamp, sequence, alarm id)
+        self.alarms = {}    # alarm id -> alarm dict
+        self.current = {}   # alarm id -> sequence of its live heap entry
+        self.ids = itertools.count(1)
+        self.sequence = itertools.count()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def add(self, alarm):
+        """Schedule an alarm dict with a datetime "time", returns its id"""
+        with self.condition:
+            if "id" not in alarm:
+                alarm["id"] = next(self.ids)
+            self.alarms[alarm["id"]] = alarm
+            entry = (alarm["time"].timestamp(), next(self.sequence), alarm["id"])
+            # Any older entry for this id is now stale, even if the id is re-added
+            self.current[alarm["id"]] = entry[1]
+            heapq.heappush(self.heap, entry)
+            # Only the worker's deadline can change, and only if this is now first
+            if self.heap[0] is entry:
+                self.condition.notify()
+        return alarm["id"]
+
+    def remove(self, alarm_id):
+        """Cancel a scheduled alarm, returns the removed alarm or None"""
+        with self.condition:
+            alarm = self.alarms.pop(alarm_id, None)
+            if alarm is None:
+                return None
+            del self.current[alarm_id]
+            # The heap entry is left behind and skipped once it reaches the top
+            self._discard_stale()
+            self.condition.notify()
+        return alarm
+
+    def pending(self):
+        """Scheduled alarms in firing order"""
+        with self.condition:
+            return sorted(self.alarms.values(), key=lambda alarm: alarm["time"])
+
+    def next_deadline(self):
+        with self.condition:
+            self._discard_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def __len__(self):
+        return len(self.alarms)
+
+    def _is_live(self, entry):
+        return self.current.get(entry[2]) == entry[1]
+
+    def _discard_stale(self):
+        while self.heap and not self._is_live(self.heap[0]):
+            heapq.heappop(self.heap)
+        # Rebuild if cancelled entries dominate the heap
+        if len(self.heap) > 2 * len(self.alarms) + 64:
+            self.heap = [entry for entry in self.heap if self._is_live(entry)]
+            heapq.heapify(self.heap)
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if self._is_live(entry):
+                del self.current[entry[2]]
+                due.append(self.alarms.pop(entry[2]))
+        return due
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    self._discard_stale()
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    delay = self.heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(min(delay, MAX_SLEEP))
+                if not self.running:
+                    return
+                due = self._pop_due(time.time())
+
+            # Fire outside the lock so callbacks can add or remove alarms
+            for alarm in due:
+                try:
+                    self.on_fire(alarm)
+                except Exception as e:
+                    # One failing alarm must not stop the ones after it
+                    print(f"Error firing alarm {alarm.get('id')}: {e!r}", file=sys.stderr)
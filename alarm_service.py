@@ -0,0 +1,112 @@
+import datetime
+import sys
+import time
+
+import metrics
+from alarm_recurrence import next_occurrence
+from alarm_scheduler import AlarmScheduler
+from alarm_store import AlarmStore, split_missed
+
+
+class AlarmService:
+    """The alarm set without any user interface
+
+    Ties the persistent AlarmStore to the AlarmScheduler: alarms added here
+    are journaled and scheduled, deleted ones are dropped from both, and a
+    fired alarm is removed from the store before on_fire sees it. A fired
+    recurring alarm is instead moved to its next occurrence, keeping its id,
+    and passed to on_rescheduled. Used directly by the Tk app and by the
+    alarm daemon.
+
+    on_added(alarms) and on_removed(alarm ids) run on the calling thread;
+    on_fire(alarm) and on_rescheduled(alarm) run on the scheduler thread.
+    """
+
+    def __init__(self, store=None, on_fire=None, on_added=None, on_removed=None, on_rescheduled=None):
+        self.store = store or AlarmStore()
+        self.on_fire = on_fire
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.on_rescheduled = on_rescheduled
+        self.scheduler = AlarmScheduler(self.fire)
+        self.missed = []
+
+    def restore(self, missed_policy="fire"):
+        """Load saved alarms, returns (scheduled, missed) lists
+
+        Missed alarms that missed_policy drops are removed now, or moved to
+        their next occurrence if they repeat; the ones it keeps fire when
+        start() is called.
+        """
+        now = datetime.datetime.now()
+        recovered = self.store.load()
+        pending, missed, dropped = split_missed(recovered, now, missed_policy)
+        advanced = [self.following(alarm, now) for alarm in dropped]
+        self.store.remove_many([alarm["id"] for alarm, following in zip(dropped, advanced) if following is None])
+        advanced = [alarm for alarm in advanced if alarm is not None]
+        self.store.add_many(advanced)
+        pending = sorted(pending + advanced, key=lambda alarm: alarm["time"])
+        for alarm in pending:
+            self.scheduler.add(alarm)
+        self.missed = missed
+        if pending and self.on_added:
+            self.on_added(pending)
+        return pending, missed
+
+    def start(self):
+        self.scheduler.start()
+        for alarm in self.missed:
+            self.fire(alarm)
+        self.missed = []
+
+    def stop(self):
+        self.scheduler.stop()
+        self.store.close()
+
+    def add_alarms(self, alarms):
+        """Journal and schedule alarm dicts, assigning ids; returns them"""
+        for alarm in alarms:
+            alarm["id"] = self.store.new_id()
+        self.store.add_many(alarms)
+        for alarm in alarms:
+            self.scheduler.add(alarm)
+        if alarms and self.on_added:
+            self.on_added(alarms)
+        return alarms
+
+    def delete_alarms(self, alarm_ids):
+        """Cancel alarms, returns the ids that existed"""
+        removed = [alarm_id for alarm_id in alarm_ids if self.scheduler.remove(alarm_id) is not None]
+        self.store.remove_many(removed)
+        if removed and self.on_removed:
+            self.on_removed(removed)
+        return removed
+
+    def alarms(self):
+        """Scheduled alarms in firing order"""
+        return self.scheduler.pending()
+
+    @staticmethod
+    def following(alarm, now):
+        """A copy of a recurring alarm at its next occurrence, or None"""
+        try:
+            next_time = next_occurrence(alarm, now)
+        except ValueError as e:
+            print(f"Alarm {alarm['id']} will not repeat: {e}", file=sys.stderr)
+            return None
+        return dict(alarm, time=next_time) if next_time is not None else None
+
+    def fire(self, alarm):
+        metrics.ALARM_FIRE_SKEW.observe(max(0.0, time.time() - alarm["time"].timestamp()))
+        metrics.ALARMS_FIRED.inc()
+        following = self.following(alarm, datetime.datetime.now())
+        if following is None:
+            self.store.remove(alarm["id"])
+        else:
+            # Replaces the journaled alarm with the same id
+            self.store.add(following)
+            self.scheduler.add(following)
+        if self.on_fire:
+            self.on_fire(alarm)
+        if following is not None and self.on_rescheduled:
+            self.on_rescheduled(following)
@@ -0,0 +1,203 @@
+import datetime
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_JOURNAL_PATH = "alarms.journal"
+DEFAULT_SNAPSHOT_PATH = "alarms.snapshot.json"
+
+# What to do with alarms whose time passed while the app was not running
+MISSED_POLICIES = ("fire", "latest", "skip")
+
+
+class JournalLockedError(OSError):
+    """The journal is locked by another process, usually the alarm daemon"""
+
+
+def encode_alarm(alarm):
+    record = dict(alarm)
+    record["time"] = alarm["time"].isoformat()
+    return record
+
+
+def decode_alarm(record):
+    alarm = dict(record)
+    alarm["time"] = datetime.datetime.fromisoformat(record["time"])
+    return alarm
+
+
+class AlarmStore:
+    """Persistent alarm set: a snapshot file plus an append-only journal
+
+    Every add or delete appends one JSON line to the journal (fsync'ed when
+    sync is on). Once the journal grows past compact_after records it is
+    folded into a fresh snapshot and truncated, so startup only replays the
+    snapshot and the changes made since the last compaction. Replaying is
+    idempotent, which makes a crash between writing the snapshot and
+    truncating the journal harmless. The journal is locked while open, so
+    two processes cannot write the same alarm set.
+    """
+
+    def __init__(self, journal_path=DEFAULT_JOURNAL_PATH, snapshot_path=DEFAULT_SNAPSHOT_PATH,
+                 sync=True, compact_after=1000):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.sync = sync
+        self.compact_after = compact_after
+        self.lock = threading.Lock()
+        self.alarms = {}  # alarm id -> alarm
+        self.last_id = 0
+        self.journal_records = 0
+        self.journal = None
+
+    def load(self):
+        """Replay snapshot and journal, returns the recovered alarms
+
+        The journal is locked before anything is read or repaired, so a
+        second process gives up with JournalLockedError without touching
+        the files of the one that holds them.
+        """
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+            self.journal = open(self.journal_path, "a")
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self.journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    self.journal.close()
+                    self.journal = None
+                    raise JournalLockedError(
+                        f"{self.journal_path} is in use by another process (is the alarm daemon running?)"
+                    )
+            try:
+                return self._replay()
+            except BaseException:
+                self.journal.close()
+                self.journal = None
+                raise
+
+    def _replay(self):
+        self.alarms = {}
+        self.last_id = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+            self.last_id = snapshot.get("last_id", 0)
+            for record in snapshot.get("alarms", []):
+                alarm = decode_alarm(record)
+                self.alarms[alarm["id"]] = alarm
+
+        self.journal_records = 0
+        good_size = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; nothing after it was acknowledged
+                    break
+                self._apply(entry)
+                self.journal_records += 1
+                good_size += len(line)
+        # Cut off the torn tail so new records are not appended to it
+        if good_size < os.path.getsize(self.journal_path):
+            self.journal.truncate(good_size)
+
+        if self.journal_records >= self.compact_after:
+            self._compact()
+        return sorted(self.alarms.values(), key=lambda alarm: alarm["time"])
+
+    def _apply(self, entry):
+        if entry["op"] == "add":
+            alarm = decode_alarm(entry["alarm"])
+            self.alarms[alarm["id"]] = alarm
+            self.last_id = max(self.last_id, alarm["id"])
+        elif entry["op"] == "del":
+            self.alarms.pop(entry["id"], None)
+
+    def new_id(self):
+        with self.lock:
+            self.last_id += 1
+            return self.last_id
+
+    def add(self, alarm):
+        self.add_many([alarm])
+
+    def add_many(self, alarms):
+        """Add alarms with a single journal write and fsync"""
+        with self.lock:
+            for alarm in alarms:
+                self.alarms[alarm["id"]] = alarm
+                self.last_id = max(self.last_id, alarm["id"])
+            self._append([{"op": "add", "alarm": encode_alarm(alarm)} for alarm in alarms])
+
+    def remove(self, alarm_id):
+        self.remove_many([alarm_id])
+
+    def remove_many(self, alarm_ids):
+        with self.lock:
+            removed = [alarm_id for alarm_id in alarm_ids if self.alarms.pop(alarm_id, None) is not None]
+            self._append([{"op": "del", "id": alarm_id} for alarm_id in removed])
+
+    def _append(self, entries):
+        if not entries:
+            return
+        if self.journal is None:
+            raise OSError(f"{self.journal_path} is not open; load() the alarm store first")
+        self.journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self.journal.flush()
+        if self.sync:
+            os.fsync(self.journal.fileno())
+        self.journal_records += len(entries)
+        if self.journal_records >= self.compact_after:
+            self._compact()
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        """Write the live alarm set as a new snapshot and empty the journal"""
+        snapshot = {
+            "last_id": self.last_id,
+            "alarms": [encode_alarm(alarm) for alarm in self.alarms.values()]
+        }
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # Truncated in place so the journal stays locked
+        self.journal.truncate(0)
+        if self.sync:
+            os.fsync(self.journal.fileno())
+        self.journal_records = 0
+
+    def close(self):
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+
+
+def split_missed(alarms, now, policy="fire"):
+    """Split recovered alarms into (still pending, to fire now, dropped)
+
+    "fire" rings every missed alarm, "latest" only the most recent one and
+    "skip" none of them.
+    """
+    pending = [alarm for alarm in alarms if alarm["time"] > now]
+    missed = [alarm for alarm in alarms if alarm["time"] <= now]
+    if policy == "fire":
+        return pending, missed, []
+    if policy == "latest" and missed:
+        return pending, missed[-1:], missed[:-1]
+    return pending, [], missed
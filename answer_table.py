@@ -0,0 +1,88 @@
+import bisect
+
+import chess
+
+
+class AnswerTable:
+    """Every accepted spelling of every legal move in one position
+
+    Built once per puzzle position. Maps UCI (e2e4), capture UCI (e2xe4),
+    long algebraic (e2-e4, Ng1-f3, Ng1f3), SAN with or without the check suffix
+    (Nf3, Qxf7#, Qxf7), castling with O or 0, and promotions with or
+    without '=' to the chess.Move they stand for, so checking an answer is a
+    single dict lookup. Lookups are exact first and then case-insensitive,
+    where a lowercase spelling is only accepted if it names one move ("bxc3"
+    could be a pawn or a bishop capture).
+    """
+
+    AMBIGUOUS = object()
+
+    def __init__(self, board):
+        self.exact = {}
+        self.folded = {}
+        self.san = {}  # move -> SAN, for completions and messages
+
+        for move in board.legal_moves:
+            san = board.san(move)
+            self.san[move] = san
+            for spelling in self.spellings(board, move, san):
+                self.exact[spelling] = move
+                key = spelling.lower()
+                if self.folded.get(key, move) != move:
+                    self.folded[key] = self.AMBIGUOUS
+                else:
+                    self.folded[key] = move
+
+        # Sorted display spellings for prefix completion
+        self.completion_keys = sorted(
+            set((san.lower(), san) for san in self.san.values())
+            | set((move.uci(), move.uci()) for move in self.san)
+        )
+
+    @staticmethod
+    def spellings(board, move, san):
+        uci = move.uci()
+        names = {uci, uci[:2] + "x" + uci[2:], uci[:2] + "-" + uci[2:]}
+
+        bare_san = san.rstrip("+#")
+        names.update((san, bare_san))
+        if move.promotion:
+            names.add(bare_san.replace("=", ""))
+        if bare_san.startswith("O-O"):
+            names.add(bare_san.replace("O", "0"))
+        else:
+            # Long algebraic with the piece letter: Ng1-f3, Bc4xf7
+            piece = board.piece_at(move.from_square)
+            letter = "" if piece.piece_type == chess.PAWN else piece.symbol().upper()
+            separator = "x" if board.is_capture(move) else "-"
+            promotion = bare_san[bare_san.index("="):] if move.promotion else ""
+            names.add(letter + uci[:2] + separator + uci[2:4] + promotion)
+            names.add(letter + uci[:4] + promotion)
+        return names
+
+    def lookup(self, text):
+        """The legal move spelled by text, or None"""
+        text = text.strip()
+        move = self.exact.get(text)
+        if move is None:
+            move = self.folded.get(text.lower())
+        if move is self.AMBIGUOUS:
+            return None
+        return move
+
+    def is_ambiguous(self, text):
+        text = text.strip()
+        return text not in self.exact and self.folded.get(text.lower()) is self.AMBIGUOUS
+
+    def completions(self, prefix, limit=8):
+        """SAN and UCI spellings that start with prefix (case-insensitive)"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.completion_keys, (prefix,))
+        matches = []
+        for key, display in self.completion_keys[start:]:
+            if not key.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(display)
+        return matches
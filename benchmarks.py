@@ -0,0 +1,526 @@
+"""Headless benchmarks for the app's hot paths
+
+Runs without a display: the board canvas is driven through tkinter's real
+Python widget code with a fake Tcl interpreter underneath, which records
+the Tcl commands that would have been sent. Results are written as JSON
+lines, one record per benchmark, so runs can be compared between releases.
+
+    python benchmarks.py --output bench.jsonl
+    python benchmarks.py --only store --corpus-sizes 10,1000,1000000
+    python benchmarks.py --only mine --pgn games.pgn --mine-workers 1,2,4,8
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import chess
+
+from alarm_daemon import AlarmDaemon, DaemonClient
+from alarm_scheduler import AlarmScheduler
+from alarm_store import AlarmStore
+from answer_table import AnswerTable
+from puzzle_mine import JsonLinesSink, mine_archive
+from puzzle_rating import PuzzleSelector
+from puzzle_solver import PuzzleSession, Solver
+from puzzle_store import PuzzleStore, BUILTIN_PUZZLES
+from puzzle_table import PuzzleTable
+from Chess_Clock import ChessBoardCanvas, SOLVER_NODE_LIMIT
+
+DEFAULT_CORPUS_SIZES = [10, 1000, 100000]
+DEFAULT_ALARM_COUNTS = [10, 1000, 100000]
+
+# Mate puzzles of the kinds the app ships and mines: (name, FEN, mate in)
+MATE_POSITIONS = [
+    ("queen and king", "7k/8/5K2/8/8/8/8/6Q1 w - - 0 1", 1),
+    ("legal", "r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 1", 2),
+    ("smothered", "1r5k/6pp/7N/3Q4/8/8/5PPP/6K1 w - - 0 1", 2),
+    ("queen sacrifice", "r1bq2r1/b4pk1/p1pp1p2/1p2pP2/1P2P1PB/3P4/1PPQ2P1/R3K2R w KQ - 0 1", 2),
+    ("anastasia", "5rk1/1b3ppp/8/2RN4/8/8/2Q2PPP/6K1 w - - 0 1", 3),
+]
+
+
+class FakeTcl:
+    """Stands in for the Tcl interpreter behind a tkinter widget"""
+
+    def __init__(self):
+        self.calls = 0
+        self.next_item = 0
+
+    def call(self, *args):
+        if len(args) == 1 and isinstance(args[0], tuple):
+            args = args[0]
+        self.calls += 1
+        if len(args) > 1 and args[1] == "create":
+            self.next_item += 1
+            return self.next_item
+        return ""
+
+    def getint(self, value):
+        return int(value)
+
+    def createcommand(self, name, func):
+        pass
+
+    def deletecommand(self, name):
+        pass
+
+    def splitlist(self, value):
+        return tuple(value) if isinstance(value, (list, tuple)) else ()
+
+
+class FakeRoot:
+    """Just enough of a Tk root for widgets to be constructed against"""
+
+    def __init__(self):
+        self.tk = FakeTcl()
+        self._w = "."
+        self._last_child_ids = None
+        self.children = {}
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_us": samples[0] * 1e6,
+        "median_us": statistics.median(samples) * 1e6,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6,
+        "max_us": samples[-1] * 1e6
+    }
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def puzzle_positions():
+    """Boards from the built-in puzzles that python-chess can parse"""
+    return [chess.Board(puzzle["fen"]) for puzzle in BUILTIN_PUZZLES]
+
+
+def bench_board(runs):
+    root = FakeRoot()
+    canvas = ChessBoardCanvas(root)
+    positions = puzzle_positions()
+    results = []
+
+    def full_redraw():
+        canvas.draw_board()
+
+    root.tk.calls = 0
+    stats = timed(full_redraw, runs)
+    stats["tcl_calls_per_op"] = root.tk.calls / runs
+    results.append(("board.draw_board", {}, stats))
+
+    # Switching between unrelated puzzle positions
+    index = [0]
+
+    def new_position():
+        index[0] = (index[0] + 1) % len(positions)
+        canvas.update_board(positions[index[0]])
+
+    root.tk.calls = 0
+    stats = timed(new_position, runs)
+    stats["tcl_calls_per_op"] = root.tk.calls / runs
+    results.append(("board.update_board", {"change": "new position"}, stats))
+
+    # A single move pushed onto the displayed board, as check_move does
+    board = chess.Board()
+    canvas.update_board(board)
+    rng = random.Random(1)
+
+    def one_move():
+        if board.is_game_over() or board.ply() > 200:
+            board.reset()
+        board.push(rng.choice(list(board.legal_moves)))
+        canvas.update_board(board)
+
+    root.tk.calls = 0
+    stats = timed(one_move, runs)
+    stats["tcl_calls_per_op"] = root.tk.calls / runs
+    results.append(("board.update_board", {"change": "one move"}, stats))
+
+    def theme():
+        canvas.set_colors("#DEE3E6", "#8CA2AD")
+
+    root.tk.calls = 0
+    stats = timed(theme, runs)
+    stats["tcl_calls_per_op"] = root.tk.calls / runs
+    results.append(("board.set_colors", {}, stats))
+
+    # Settled resizes between two window sizes
+    sizes = [(400, 400), (800, 640)]
+    turn = [0]
+
+    def resize():
+        turn[0] += 1
+        canvas.resize(*sizes[turn[0] % 2])
+
+    root.tk.calls = 0
+    stats = timed(resize, runs)
+    stats["tcl_calls_per_op"] = root.tk.calls / runs
+    stats["piece_images"] = canvas.piece_images is not None
+    results.append(("board.resize", {}, stats))
+    return results
+
+
+def build_store(path, size):
+    store = PuzzleStore(path, legacy_json=None)
+    remaining = size - store.count()
+    difficulties = ["easy", "medium", "hard"]
+    batch = []
+    for i in range(remaining):
+        template = BUILTIN_PUZZLES[i % len(BUILTIN_PUZZLES)]
+        # Synthetic hashes keep the repeated positions from being deduplicated
+        batch.append(dict(template, difficulty=difficulties[i % 3], position_hash=i))
+        if len(batch) >= 50000:
+            store.add_puzzles(batch)
+            batch = []
+    if batch:
+        store.add_puzzles(batch)
+    return store
+
+
+def bench_store(sizes, runs, directory):
+    results = []
+    rng = random.Random(2)
+    for size in sizes:
+        path = os.path.join(directory, f"puzzles_{size}.db")
+        start = time.perf_counter()
+        store = build_store(path, size)
+        build_seconds = time.perf_counter() - start
+        store.close()
+
+        # Opening the store is all that happens at startup
+        stats = timed(lambda: PuzzleStore(path, legacy_json=None).close(), min(runs, 50))
+        stats["build_seconds"] = build_seconds
+        results.append(("store.open", {"puzzles": size}, stats))
+
+        store = PuzzleStore(path, legacy_json=None)
+        stats = timed(lambda: store.random_puzzle(difficulty="medium", rng=rng), runs)
+        results.append(("store.random_puzzle", {"puzzles": size, "difficulty": "medium"}, stats))
+        stats = timed(lambda: store.random_puzzle(rng=rng), runs)
+        results.append(("store.random_puzzle", {"puzzles": size}, stats))
+
+        selector = PuzzleSelector(store, user="benchmark", rng=rng)
+
+        def load_puzzle():
+            # The non-widget part of ChessPuzzleAlarm.load_puzzle/show_puzzle
+            puzzle = selector.next_puzzle("easy")
+            board = chess.Board(puzzle["fen"])
+            AnswerTable(board)
+
+        stats = timed(load_puzzle, runs)
+        results.append(("app.load_puzzle", {"puzzles": size}, stats))
+        stats = timed(selector.next_adaptive, runs)
+        results.append(("selector.next_adaptive", {"puzzles": size}, stats))
+        puzzle = selector.next_puzzle("medium")
+        stats = timed(lambda: selector.record_result(puzzle, 20.0, 1), runs)
+        results.append(("selector.record_result", {"puzzles": size}, stats))
+
+        start = time.perf_counter()
+        index = store.position_index()
+        stats = {"load_s": time.perf_counter() - start, "bytes": index.sorted.itemsize * len(index.sorted)}
+        results.append(("store.position_index", {"puzzles": size}, stats))
+        board = chess.Board(BUILTIN_PUZZLES[1]["fen"])
+        stats = timed(lambda: store.has_position(board), runs)
+        results.append(("store.has_position", {"puzzles": size}, stats))
+        store.close()
+    return results
+
+
+def bench_moves(runs):
+    results = []
+    boards = puzzle_positions()
+    index = [0]
+
+    def build():
+        index[0] = (index[0] + 1) % len(boards)
+        AnswerTable(boards[index[0]])
+
+    results.append(("answers.build", {}, timed(build, runs)))
+
+    board = chess.Board(BUILTIN_PUZZLES[1]["fen"])
+    table = AnswerTable(board)
+    for spelling in ("f3g5", "f3xg5", "Ng5", "ng5", "Nf3-g5", "zz9"):
+        stats = timed(lambda: table.lookup(spelling), runs)
+        results.append(("answers.lookup", {"input": spelling}, stats))
+    stats = timed(lambda: table.completions("n"), runs)
+    results.append(("answers.completions", {"prefix": "n"}, stats))
+    return results
+
+
+def random_puzzles(count, rng):
+    """Puzzles from random games: middlegame positions with 1-6 move lines"""
+    puzzles = []
+    while len(puzzles) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(10, 80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        line = board.copy()
+        solution = []
+        for _ in range(rng.choice((1, 2, 4, 6))):
+            moves = list(line.legal_moves)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            solution.append(move.uci())
+            line.push(move)
+        if solution:
+            puzzles.append({
+                "id": len(puzzles) + 1,
+                "fen": board.fen(),
+                "description": rng.choice(("Mate in 2", "Win material for White", "Find the best move")),
+                "solution": " ".join(solution),
+                "difficulty": rng.choice(("easy", "medium", "hard")),
+                "themes": rng.choice(("mate mateIn2", "fork", "pin short", "")),
+                "rating": float(rng.randint(800, 2800)),
+                "rating_deviation": 80.0
+            })
+    return puzzles
+
+
+def bench_table(runs):
+    """Memory per puzzle and board building, packed table against dicts"""
+    puzzles = random_puzzles(2000, random.Random(1))
+    table = PuzzleTable.from_puzzles(puzzles)
+    dict_bytes = sum(
+        sys.getsizeof(puzzle) + sum(sys.getsizeof(value) for value in puzzle.values()) for puzzle in puzzles
+    )
+    results = [("table.memory", {"puzzles": len(puzzles)}, {
+        "table_bytes_per_puzzle": table.nbytes() / len(table),
+        "dict_bytes_per_puzzle": dict_bytes / len(puzzles)
+    })]
+
+    index = [0]
+
+    def from_table():
+        index[0] = (index[0] + 1) % len(table)
+        table.board(index[0])
+
+    def from_fen():
+        index[0] = (index[0] + 1) % len(puzzles)
+        chess.Board(puzzles[index[0]]["fen"])
+
+    results.append(("table.board", {}, timed(from_table, runs)))
+    results.append(("table.board_from_fen", {}, timed(from_fen, runs)))
+    results.append(("table.puzzle", {}, timed(lambda: table[index[0]], runs)))
+    return results
+
+
+def bench_solver(runs):
+    """Judging a submitted move with a fresh solver, as check_move does"""
+    results = []
+    runs = min(runs, 50)
+    for name, fen, mate_in in MATE_POSITIONS:
+        board = chess.Board(fen)
+        solver = Solver()
+        solution = next(move for move in board.legal_moves if solver.mates_after(board, move, mate_in))
+        wrong = next(move for move in board.legal_moves if not solver.mates_after(board, move, mate_in))
+        # The puzzle names a different move, so the solver has to prove the answer
+        puzzle = {"solution": wrong.uci(), "description": f"Mate in {mate_in}"}
+
+        def submit(move):
+            session = PuzzleSession(chess.Board(fen), puzzle, Solver(SOLVER_NODE_LIMIT))
+            session.submit(move)
+
+        stats = timed(lambda: submit(solution), runs)
+        results.append(("solver.accept_alternative", {"position": name, "mate_in": mate_in}, stats))
+        puzzle = {"solution": solution.uci(), "description": f"Mate in {mate_in}"}
+        stats = timed(lambda: submit(wrong), runs)
+        results.append(("solver.reject", {"position": name, "mate_in": mate_in}, stats))
+    return results
+
+
+def bench_alarms(counts):
+    results = []
+    for count in counts:
+        fired = []
+        scheduler = AlarmScheduler(lambda alarm: fired.append(time.time() - alarm["time"].timestamp()))
+        now = datetime.datetime.now()
+
+        alarms = [{"time": now + datetime.timedelta(seconds=1 + random.random() * 86400)} for _ in range(count)]
+        start = time.perf_counter()
+        ids = [scheduler.add(alarm) for alarm in alarms]
+        elapsed = time.perf_counter() - start
+        results.append(("scheduler.add", {"alarms": count}, {"total_s": elapsed, "per_op_us": elapsed / count * 1e6}))
+
+        start = time.perf_counter()
+        for alarm_id in ids:
+            scheduler.remove(alarm_id)
+        elapsed = time.perf_counter() - start
+        results.append(("scheduler.remove", {"alarms": count}, {"total_s": elapsed, "per_op_us": elapsed / count * 1e6}))
+
+        # Fire everything within a one second window and measure lateness
+        scheduler.start()
+        base = datetime.datetime.now() + datetime.timedelta(seconds=0.5)
+        for i in range(count):
+            scheduler.add({"time": base + datetime.timedelta(seconds=i / count)})
+        deadline = time.time() + 30
+        while len(fired) < count and time.time() < deadline:
+            time.sleep(0.05)
+        scheduler.stop()
+
+        skew = sorted(fired)
+        stats = {
+            "fired": len(skew),
+            "median_skew_ms": statistics.median(skew) * 1000 if skew else None,
+            "p99_skew_ms": skew[min(len(skew) - 1, int(len(skew) * 0.99))] * 1000 if skew else None,
+            "max_skew_ms": skew[-1] * 1000 if skew else None
+        }
+        results.append(("scheduler.fire", {"alarms": count}, stats))
+    return results
+
+
+def bench_daemon(counts, directory):
+    """Bulk alarm requests over the daemon socket, journal writes included"""
+    results = []
+    daemon = AlarmDaemon(
+        os.path.join(directory, "daemon.sock"), db_path=os.path.join(directory, "daemon.db"),
+        alarm_store=AlarmStore(os.path.join(directory, "alarms.journal"), os.path.join(directory, "alarms.snapshot.json"))
+    )
+    thread = threading.Thread(target=lambda: asyncio.run(daemon.serve()), daemon=True)
+    thread.start()
+    daemon.ready.wait(30)
+    client = DaemonClient(daemon.socket_path, timeout=600)
+    try:
+        for count in counts:
+            now = datetime.datetime.now()
+            alarms = [{"time": now + datetime.timedelta(days=1, seconds=i), "difficulty": "easy"} for i in range(count)]
+
+            start = time.perf_counter()
+            ids = client.add_alarms(alarms)
+            added = time.perf_counter()
+            client.list_alarms()
+            listed = time.perf_counter()
+            client.delete_alarms(ids)
+            deleted = time.perf_counter()
+
+            for name, elapsed in (
+                ("daemon.add_alarms", added - start),
+                ("daemon.list_alarms", listed - added),
+                ("daemon.delete_alarms", deleted - listed),
+            ):
+                results.append((name, {"alarms": count}, {"total_s": elapsed, "per_op_us": elapsed / count * 1e6}))
+    finally:
+        client.request("shutdown")
+        client.close()
+        thread.join(30)
+    return results
+
+
+def bench_mine(pgn_path, worker_counts, directory):
+    """Mining throughput for each worker count, to check it scales with cores"""
+    results = []
+    for workers in worker_counts:
+        output = os.path.join(directory, f"mined_{workers}.jsonl")
+        for path in (output, output + ".checkpoint"):
+            if os.path.exists(path):
+                os.remove(path)
+        sink = JsonLinesSink(output)
+        start = time.perf_counter()
+        try:
+            games, puzzles, unreadable = mine_archive(pgn_path, sink, workers=workers)
+        finally:
+            sink.close()
+        elapsed = time.perf_counter() - start
+        stats = {"games": games, "puzzles": puzzles, "seconds": elapsed, "games_per_s": games / elapsed}
+        results.append(("mine.archive", {"workers": workers}, stats))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "python_chess": chess.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds")
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Chess Puzzle Alarm benchmarks")
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--only", action="append",
+                        choices=("board", "store", "moves", "table", "solver", "alarms", "mine"),
+                        help="run only these groups (repeatable)")
+    parser.add_argument("--runs", type=int, default=1000, help="timed runs per micro-benchmark")
+    parser.add_argument("--corpus-sizes", default=",".join(map(str, DEFAULT_CORPUS_SIZES)),
+                        help="comma separated puzzle counts, e.g. 10,1000,10000000")
+    parser.add_argument("--alarm-counts", default=",".join(map(str, DEFAULT_ALARM_COUNTS)),
+                        help="comma separated alarm counts")
+    parser.add_argument("--workdir", help="keep generated puzzle databases here for reuse")
+    parser.add_argument("--pgn", help="PGN archive for the mine group (skipped without one)")
+    parser.add_argument("--mine-workers", default=",".join(str(2 ** i) for i in range(4) if 2 ** i <= (os.cpu_count() or 1)),
+                        help="comma separated worker counts for the mine group")
+    args = parser.parse_args(argv)
+
+    groups = args.only or ["board", "store", "moves", "table", "solver", "alarms"]
+    env = environment()
+    out = open(args.output, "w") if args.output else sys.stdout
+
+    def emit(results):
+        for name, params, stats in results:
+            out.write(json.dumps({"benchmark": name, "params": params, "stats": stats, "env": env}) + "\n")
+            out.flush()
+
+    try:
+        if "board" in groups:
+            emit(bench_board(args.runs))
+        if "store" in groups:
+            sizes = [int(size) for size in args.corpus_sizes.split(",")]
+            if args.workdir:
+                os.makedirs(args.workdir, exist_ok=True)
+                emit(bench_store(sizes, args.runs, args.workdir))
+            else:
+                with tempfile.TemporaryDirectory() as directory:
+                    emit(bench_store(sizes, args.runs, directory))
+        if "moves" in groups:
+            emit(bench_moves(args.runs))
+        if "table" in groups:
+            emit(bench_table(args.runs))
+        if "solver" in groups:
+            emit(bench_solver(args.runs))
+        if "alarms" in groups:
+            counts = [int(count) for count in args.alarm_counts.split(",")]
+            emit(bench_alarms(counts))
+            with tempfile.TemporaryDirectory() as directory:
+                emit(bench_daemon(counts, directory))
+        if "mine" in groups and args.pgn:
+            with tempfile.TemporaryDirectory() as directory:
+                emit(bench_mine(args.pgn, [int(count) for count in args.mine_workers.split(",")], directory))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Latency buckets in seconds, roughly x2.5 apart from 100 us to 10 minutes
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0
+)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {"type": "counter", "value": self.value}
+
+    def prometheus(self):
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}"
+        ]
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {"type": "gauge", "value": self.value}
+
+    def prometheus(self):
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.value}"
+        ]
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and three additions"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def time(self):
+        """Context manager that observes the duration of its block"""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "type": "histogram",
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "p50": self.quantile(0.5),
+                "p90": self.quantile(0.9),
+                "p99": self.quantile(0.99)
+            }
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.sum}")
+            lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _get(self, cls, name, help_text, *args):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, *args)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def prometheus(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+
+# Process wide registry used by the app's instrumentation points
+REGISTRY = MetricsRegistry()
+
+ALARM_FIRE_SKEW = REGISTRY.histogram(
+    "alarm_fire_skew_seconds", "How late alarms fired compared with their scheduled time")
+BOARD_DRAW = REGISTRY.histogram(
+    "board_draw_seconds", "Time spent drawing or updating the chess board canvas")
+ALARM_TRIGGER = REGISTRY.histogram(
+    "alarm_trigger_seconds", "Time from an alarm being handled to its puzzle being on screen")
+PUZZLE_SOLVE = REGISTRY.histogram(
+    "puzzle_solve_seconds", "Time from a puzzle being shown to it being solved")
+PUZZLE_ATTEMPTS = REGISTRY.histogram(
+    "puzzle_attempts", "Tries per solved puzzle, counting each wrong move as one", COUNT_BUCKETS)
+ALARMS_FIRED = REGISTRY.counter("alarms_fired_total", "Alarms that have fired")
+ALARM_PUZZLES_PREFETCHED = REGISTRY.counter(
+    "alarm_puzzles_prefetched_total", "Alarms whose puzzle was ready before they fired")
+ALARM_PREFETCH_FAILURES = REGISTRY.counter(
+    "alarm_prefetch_failures_total", "Puzzle prefetches that raised, leaving the alarm to pick one when it fired")
+PUZZLES_SOLVED = REGISTRY.counter("puzzles_solved_total", "Puzzles solved")
+WRONG_MOVES = REGISTRY.counter("wrong_moves_total", "Submitted moves that were legal but wrong")
+UI_QUEUE_LATENCY = REGISTRY.histogram(
+    "ui_queue_latency_seconds", "Time from work being posted to the Tk main loop to it running")
+UI_QUEUE_DEPTH = REGISTRY.gauge("ui_queue_depth", "Callbacks left queued for the Tk main loop after a drain")
+UI_POSTS_MERGED = REGISTRY.counter(
+    "ui_posts_merged_total", "Main-loop updates dropped because a newer one replaced them")
+
+
+class MetricsExporter:
+    """Periodically writes the registry to a local file
+
+    "jsonl" appends one JSON snapshot per interval and rotates the file once
+    it exceeds max_bytes, keeping `backups` old files. "prometheus" rewrites
+    the file atomically in the text exposition format, suitable for the
+    node_exporter textfile collector.
+    """
+
+    def __init__(self, path, fmt="jsonl", interval=60.0, max_bytes=1024 * 1024, backups=3, registry=REGISTRY):
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.registry = registry
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.export()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.export()
+            except OSError as e:
+                print(f"Could not write metrics to {self.path}: {e}")
+
+    def export(self):
+        if self.fmt == "prometheus":
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                f.write(self.registry.prometheus())
+            os.replace(temp_path, self.path)
+            return
+
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self.rotate()
+        record = {"timestamp": time.time(), "metrics": self.registry.snapshot()}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
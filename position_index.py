@@ -0,0 +1,75 @@
+import array
+import bisect
+
+import chess
+import chess.polyglot
+
+
+def position_hash(board):
+    """Zobrist hash of a board as a signed 64-bit SQLite integer"""
+    value = chess.polyglot.zobrist_hash(board)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class PositionIndex:
+    """Set of position hashes at 8 bytes per position
+
+    Hashes live in a sorted array of signed 64-bit integers searched with
+    bisect, so tens of millions of positions take a few hundred megabytes at
+    most instead of the gigabytes a set of Python ints would need. New
+    hashes go to a small set first and are merged into the array once that
+    set reaches a sixteenth of its size, which keeps inserts amortized cheap.
+    Positions reached by different move orders share a hash, so
+    transpositions count as the same position.
+    """
+
+    MIN_MERGE = 4096
+
+    def __init__(self, hashes=()):
+        self.sorted = array.array("q", sorted(hashes))
+        self.recent = set()
+
+    @classmethod
+    def from_sorted(cls, chunks):
+        """Build from chunks of hashes that are already in ascending order"""
+        index = cls()
+        for chunk in chunks:
+            index.sorted.extend(chunk)
+        return index
+
+    def __len__(self):
+        return len(self.sorted) + len(self.recent)
+
+    def __contains__(self, value):
+        if value in self.recent:
+            return True
+        i = bisect.bisect_left(self.sorted, value)
+        return i < len(self.sorted) and self.sorted[i] == value
+
+    def add(self, value):
+        """Add a hash, returns False if it was already present"""
+        if value in self:
+            return False
+        self.recent.add(value)
+        if len(self.recent) >= max(self.MIN_MERGE, len(self.sorted) // 16):
+            self.merge()
+        return True
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self):
+        if not self.recent:
+            return
+        merged = array.array("q")
+        recent = sorted(self.recent)
+        start = 0
+        for value in recent:
+            end = bisect.bisect_left(self.sorted, value, start)
+            merged.extend(self.sorted[start:end])
+            merged.append(value)
+            start = end
+        merged.extend(self.sorted[start:])
+        self.sorted = merged
+        self.recent = set()
@@ -0,0 +1,267 @@
+"""Bulk puzzle importer
+
+Streams Lichess-style CSV or JSON-lines puzzle dumps (optionally gzip, bz2 or
+xz compressed) into the puzzle database. Rows are validated with python-chess
+in a process pool and written in batches; rows that fail validation are
+written to a report file instead of being dropped.
+
+    python puzzle_import.py lichess_db_puzzle.csv.bz2 --report rejected.jsonl
+"""
+
+import argparse
+import bz2
+import concurrent.futures
+import csv
+import gzip
+import io
+import itertools
+import json
+import lzma
+import os
+import re
+import sys
+import time
+
+import chess
+
+from position_index import position_hash
+from puzzle_store import PuzzleStore, DEFAULT_DB_PATH
+
+# Column order of the Lichess puzzle dump, used when the file has no header
+LICHESS_COLUMNS = [
+    "PuzzleId", "FEN", "Moves", "Rating", "RatingDeviation", "Popularity",
+    "NbPlays", "Themes", "GameUrl", "OpeningTags"
+]
+
+DIFFICULTY_LIMITS = [(1500, "easy"), (2000, "medium")]
+
+
+def open_input(path):
+    """Open a possibly compressed file for streaming text reads"""
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", newline="")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def detect_format(path):
+    name = path
+    for suffix in (".gz", ".bz2", ".xz"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return "csv" if name.endswith(".csv") else "jsonl"
+
+
+def read_csv_rows(f):
+    """Yield (line number, row dict) from a Lichess CSV dump"""
+    reader = csv.reader(f)
+    columns = LICHESS_COLUMNS
+    for row in reader:
+        if not row:
+            continue
+        if reader.line_num == 1 and row[0] == "PuzzleId":
+            columns = row
+            continue
+        yield reader.line_num, dict(zip(columns, row))
+
+
+def read_jsonl_rows(f):
+    """Yield (line number, row) from a JSON-lines dump
+
+    Lines that are not valid JSON are passed through as strings so the
+    worker can reject them with a reason.
+    """
+    for line_num, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError:
+            yield line_num, line
+
+
+def difficulty_for_rating(rating):
+    for limit, difficulty in DIFFICULTY_LIMITS:
+        if rating < limit:
+            return difficulty
+    return "hard"
+
+
+def describe(themes, board):
+    """Build a puzzle description from Lichess themes"""
+    for theme in themes:
+        match = re.fullmatch(r"mateIn(\d+)", theme)
+        if match:
+            return f"Mate in {match.group(1)}"
+    side = "White" if board.turn == chess.WHITE else "Black"
+    return f"Find the best move for {side}"
+
+
+def convert_row(row):
+    """Validate one input row and convert it to the app's puzzle schema
+
+    Raises ValueError with a human readable reason if the row is rejected.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+
+    if "FEN" in row:
+        # Lichess format: the first move is the opponent's, the puzzle starts
+        # after it and the rest of the moves are the solution line
+        board = chess.Board(row["FEN"])
+        if not board.is_valid():
+            raise ValueError("invalid position")
+        moves = row.get("Moves", "").split()
+        if len(moves) < 2:
+            raise ValueError("solution needs at least two moves")
+        for uci in moves:
+            move = chess.Move.from_uci(uci)
+            if move not in board.legal_moves:
+                raise ValueError(f"illegal move {uci}")
+            board.push(move)
+        board = chess.Board(row["FEN"])
+        board.push_uci(moves[0])
+        themes = row.get("Themes", "").split()
+        try:
+            rating = int(row.get("Rating") or 1500)
+        except ValueError:
+            raise ValueError(f"bad rating {row.get('Rating')!r}")
+        return {
+            "fen": board.fen(),
+            "description": describe(themes, board),
+            "solution": " ".join(moves[1:]),
+            "difficulty": difficulty_for_rating(rating),
+            "themes": " ".join(themes),
+            "rating": rating
+        }
+
+    for key in ("fen", "solution", "difficulty"):
+        if key not in row:
+            raise ValueError(f"missing {key}")
+    board = chess.Board(row["fen"])
+    if not board.is_valid():
+        raise ValueError("invalid position")
+    replay = board.copy()
+    for uci in row["solution"].split():
+        move = chess.Move.from_uci(uci)
+        if move not in replay.legal_moves:
+            raise ValueError(f"illegal move {uci}")
+        replay.push(move)
+    if not replay.move_stack:
+        raise ValueError("empty solution")
+    themes = row.get("themes", "")
+    if not isinstance(themes, str):
+        themes = " ".join(themes)
+    puzzle = {
+        "fen": board.fen(),
+        "description": row.get("description") or describe(themes.split(), board),
+        "solution": row["solution"],
+        "difficulty": row["difficulty"],
+        "themes": themes
+    }
+    if row.get("rating") is not None:
+        try:
+            puzzle["rating"] = float(row["rating"])
+        except (TypeError, ValueError):
+            raise ValueError(f"bad rating {row['rating']!r}")
+    return puzzle
+
+
+def validate_batch(rows):
+    """Worker entry point: returns (accepted puzzles, rejected rows)"""
+    accepted = []
+    rejected = []
+    for line_num, row in rows:
+        try:
+            puzzle = convert_row(row)
+            # Hashed here so the writing process only has to look it up
+            puzzle["position_hash"] = position_hash(chess.Board(puzzle["fen"]))
+            accepted.append(puzzle)
+        except (ValueError, KeyError, TypeError) as e:
+            rejected.append({"line": line_num, "reason": str(e) or type(e).__name__, "row": row})
+    return accepted, rejected
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_puzzles(path, store, fmt=None, report=None, batch_size=5000, workers=None):
+    """Stream one dump into the store, returns (imported, duplicate, rejected) counts
+
+    At most two batches per worker are in flight at any time, so memory use
+    does not grow with the size of the input. Puzzles whose position is
+    already in the store count as duplicates and are not reported.
+    """
+    fmt = fmt or detect_format(path)
+    workers = workers or os.cpu_count() or 1
+    accepted_total = 0
+    duplicate_total = 0
+    rejected_total = 0
+
+    def collect(future):
+        nonlocal accepted_total, duplicate_total, rejected_total
+        accepted, rejected = future.result()
+        if accepted:
+            added = store.add_puzzles(accepted)
+            accepted_total += added
+            duplicate_total += len(accepted) - added
+        rejected_total += len(rejected)
+        if report:
+            for entry in rejected:
+                report.write(json.dumps(dict(entry, source=path)) + "\n")
+
+    with open_input(path) as f, concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = read_csv_rows(f) if fmt == "csv" else read_jsonl_rows(f)
+        pending = []
+        for batch in batched(rows, batch_size):
+            pending.append(pool.submit(validate_batch, batch))
+            # Write finished batches in input order to keep ids reproducible
+            while len(pending) >= workers * 2 or (pending and pending[0].done()):
+                collect(pending.pop(0))
+        for future in pending:
+            collect(future)
+
+    return accepted_total, duplicate_total, rejected_total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import puzzles into the Chess Puzzle Alarm database")
+    parser.add_argument("inputs", nargs="+", help="CSV or JSON-lines files, optionally .gz/.bz2/.xz ('-' for stdin)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="puzzle database path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from file name)")
+    parser.add_argument("--report", help="write rejected rows to this JSON-lines file")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    store = PuzzleStore(args.db)
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    try:
+        for path in args.inputs:
+            start = time.perf_counter()
+            accepted, duplicates, rejected = import_puzzles(
+                path, store, fmt=args.format, report=report,
+                batch_size=args.batch_size, workers=args.workers
+            )
+            elapsed = time.perf_counter() - start
+            print(f"{path}: imported {accepted}, skipped {duplicates} duplicates, rejected {rejected} in {elapsed:.1f}s")
+    finally:
+        if report:
+            report.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
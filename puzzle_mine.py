@@ -0,0 +1,374 @@
+"""Puzzle miner for PGN game archives
+
+Streams PGN files (optionally gzip, bz2 or xz compressed) and searches the
+positions of every game for tactics: a unique forced mate in one or two, or
+a single capture that wins material after all exchanges. The reading
+process only splits the archive into raw game texts; parsing and searching
+happen in a process pool, so throughput grows with the number of cores.
+
+Found puzzles are added to the puzzle database, or written as JSON lines in
+the puzzle file format with --output. Progress is checkpointed after every
+batch (in the database, in the same transaction as the puzzles), so an
+interrupted run over a large archive resumes where it stopped.
+
+    python puzzle_mine.py lichess_db_standard_rated_2024-01.pgn.bz2
+    python puzzle_mine.py games.pgn --output mined.jsonl
+"""
+
+import argparse
+import bz2
+import concurrent.futures
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+import time
+
+import chess
+import chess.pgn
+
+from puzzle_solver import Solver, SearchLimitReached
+from puzzle_store import PuzzleStore, DEFAULT_DB_PATH
+
+PIECE_VALUES = {
+    chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300,
+    chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0
+}
+
+# A capture must win at least this much after all exchanges
+WIN_THRESHOLD = 300
+# and no other capture may come close, so the puzzle has one answer
+RUNNER_UP_LIMIT = 100
+
+MAX_MATE_DEPTH = 2
+NODE_LIMIT = 20000
+
+# Skip the opening, and move on a few plies after a find
+MIN_PLY = 10
+SKIP_AFTER_FIND = 4
+MAX_PER_GAME = 2
+
+CHECKPOINT_PREFIX = "mine_checkpoint:"
+
+
+def open_binary(path):
+    """Open a possibly compressed file for streaming binary reads"""
+    if path == "-":
+        return sys.stdin.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_games(f, offset=0):
+    """Yield (end offset, game text) for each game from offset on
+
+    Games are split on the first tag line after a game's movetext, without
+    parsing anything. Offsets count uncompressed bytes.
+    """
+    if offset:
+        f.seek(offset)
+    lines = []
+    position = offset
+    in_moves = False
+    for line in f:
+        if in_moves and line.startswith(b"["):
+            yield position, b"".join(lines).decode("utf-8", "replace")
+            lines = []
+            in_moves = False
+        stripped = line.strip()
+        if stripped and not stripped.startswith((b"[", b"%")):
+            in_moves = True
+        lines.append(line)
+        position += len(line)
+    if in_moves:
+        yield position, b"".join(lines).decode("utf-8", "replace")
+
+
+def see_square(board, square):
+    """Material the side to move wins by capturing on square first, or 0"""
+    attackers = sorted(
+        board.attackers(board.turn, square), key=lambda attacker: PIECE_VALUES[board.piece_type_at(attacker)]
+    )
+    for attacker in attackers:
+        promotion = None
+        if board.piece_type_at(attacker) == chess.PAWN and chess.square_rank(square) in (0, 7):
+            promotion = chess.QUEEN
+        move = chess.Move(attacker, square, promotion)
+        if board.is_legal(move):
+            captured = PIECE_VALUES[board.piece_type_at(square)]
+            board.push(move)
+            try:
+                return max(0, captured - see_square(board, square))
+            finally:
+                board.pop()
+    return 0
+
+
+def see_move(board, move):
+    """Static exchange value of a capture for the side making it"""
+    captured = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+    board.push(move)
+    try:
+        return PIECE_VALUES[captured] - see_square(board, move.to_square)
+    finally:
+        board.pop()
+
+
+def find_mate(board, max_depth=MAX_MATE_DEPTH):
+    """(depth, move) for a unique shortest forced mate, or None"""
+    solver = Solver(NODE_LIMIT)
+    try:
+        depth = solver.mate_in(board, max_depth)
+        if depth is None:
+            return None
+        found = []
+        for move in board.legal_moves:
+            if solver.mates_after(board, move, depth):
+                found.append(move)
+                if len(found) > 1:
+                    return None
+    except SearchLimitReached:
+        return None
+    return depth, found[0]
+
+
+def find_winning_capture(board):
+    """(gain, move) for the only capture that wins material, or None"""
+    # Recapturing after a trade is not a puzzle
+    last = board.peek() if board.move_stack else None
+    gains = []
+    for move in board.generate_legal_captures():
+        if last is not None and move.to_square == last.to_square:
+            continue
+        gains.append((see_move(board, move), move))
+    if not gains:
+        return None
+    gains.sort(key=lambda entry: entry[0], reverse=True)
+    gain, move = gains[0]
+    if gain < WIN_THRESHOLD or (len(gains) > 1 and gains[1][0] > RUNNER_UP_LIMIT):
+        return None
+
+    # One ply deeper: the opponent must not be able to win it straight back
+    board.push(move)
+    try:
+        if find_mate(board, 1):
+            return None
+        for reply in board.generate_legal_captures():
+            if see_move(board, reply) > gain - WIN_THRESHOLD:
+                return None
+    finally:
+        board.pop()
+    return gain, move
+
+
+def mine_position(board, sharp):
+    """A puzzle dict for the side to move, or None
+
+    Mates in more than one move are only searched in sharp positions (where
+    the game continued with a check), which keeps the cost per quiet
+    position to a handful of move generations.
+    """
+    side = "White" if board.turn == chess.WHITE else "Black"
+    mate = find_mate(board, MAX_MATE_DEPTH if sharp else 1)
+    if mate:
+        depth, move = mate
+        return {
+            "fen": board.fen(),
+            "description": f"Mate in {depth}",
+            "solution": move.uci(),
+            "difficulty": "easy" if depth == 1 else "hard",
+            "themes": f"mate mateIn{depth}"
+        }
+
+    capture = find_winning_capture(board)
+    if capture:
+        gain, move = capture
+        hanging = gain >= PIECE_VALUES[board.piece_type_at(move.to_square) or chess.PAWN]
+        return {
+            "fen": board.fen(),
+            "description": f"Win material for {side}",
+            "solution": move.uci(),
+            "difficulty": "easy" if hanging else "medium",
+            "themes": "hangingPiece" if hanging else "advantage"
+        }
+    return None
+
+
+def mine_game(text):
+    """Puzzles found in one game's PGN text; None if it could not be read"""
+    game = chess.pgn.read_game(io.StringIO(text))
+    if game is None or game.errors or game.headers.get("Variant", "Standard") not in ("Standard", "Chess"):
+        return None
+
+    puzzles = []
+    board = game.board()
+    next_ply = MIN_PLY
+    for move in game.mainline_moves():
+        if board.ply() >= next_ply and not board.is_game_over():
+            puzzle = mine_position(board, sharp=board.gives_check(move))
+            if puzzle:
+                puzzles.append(puzzle)
+                if len(puzzles) >= MAX_PER_GAME:
+                    break
+                next_ply = board.ply() + SKIP_AFTER_FIND
+        board.push(move)
+    return puzzles
+
+
+def mine_batch(texts):
+    """Worker entry point: returns (puzzles, unreadable game count)"""
+    puzzles = []
+    unreadable = 0
+    for text in texts:
+        try:
+            found = mine_game(text)
+        except ValueError:
+            found = None
+        if found is None:
+            unreadable += 1
+        else:
+            puzzles.extend(found)
+    return puzzles, unreadable
+
+
+class JsonLinesSink:
+    """Appends puzzles to a JSON-lines file with a checkpoint file beside it
+
+    The checkpoint records the output size, and the output is cut back to it
+    on resume, so a crash between the two writes cannot duplicate puzzles.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                self.checkpoints = json.load(f)
+        except (OSError, ValueError):
+            self.checkpoints = {}
+        self.file = open(path, "ab")
+        if self.checkpoints:
+            self.file.truncate(max(entry["output_bytes"] for entry in self.checkpoints.values()))
+            self.file.seek(0, os.SEEK_END)
+
+    def checkpoint(self, source):
+        return self.checkpoints.get(source)
+
+    def add(self, puzzles, source, state):
+        for puzzle in puzzles:
+            self.file.write((json.dumps(puzzle) + "\n").encode("utf-8"))
+        self.file.flush()
+        if source is None:
+            return len(puzzles)
+        os.fsync(self.file.fileno())
+        self.checkpoints[source] = dict(state, output_bytes=self.file.tell())
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.checkpoints, f)
+        os.replace(temp_path, self.checkpoint_path)
+        return len(puzzles)
+
+    def close(self):
+        self.file.close()
+
+
+class StoreSink:
+    """Adds puzzles to the puzzle database, checkpointing in the same transaction"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def checkpoint(self, source):
+        value = self.store.get_meta(CHECKPOINT_PREFIX + source)
+        return json.loads(value) if value else None
+
+    def add(self, puzzles, source, state):
+        meta = {CHECKPOINT_PREFIX + source: json.dumps(state)} if source else None
+        return self.store.add_puzzles(puzzles, meta=meta)
+
+    def close(self):
+        self.store.close()
+
+
+def batched_games(games, size):
+    batch = []
+    for end, text in games:
+        batch.append(text)
+        if len(batch) >= size:
+            yield end, batch
+            batch = []
+    if batch:
+        yield end, batch
+
+
+def mine_archive(path, sink, batch_size=200, workers=None, restart=False):
+    """Mine one archive into the sink, returns (games, puzzles, unreadable) for this run"""
+    workers = workers or os.cpu_count() or 1
+    source = os.path.abspath(path) if path != "-" else None
+
+    state = {"offset": 0, "games": 0, "puzzles": 0}
+    if source and not restart:
+        saved = sink.checkpoint(source)
+        compressed = path.endswith((".gz", ".bz2", ".xz"))
+        # A plain file shorter than the checkpoint is a different file
+        if saved and (compressed or saved["offset"] <= os.path.getsize(path)):
+            state = {key: saved[key] for key in state}
+    totals = {"games": 0, "puzzles": 0, "unreadable": 0}
+
+    def collect(end, count, future):
+        puzzles, unreadable = future.result()
+        state["offset"] = end
+        state["games"] += count
+        state["puzzles"] += len(puzzles)
+        totals["games"] += count
+        totals["unreadable"] += unreadable
+        if puzzles or source:
+            totals["puzzles"] += sink.add(puzzles, source, dict(state))
+
+    with open_binary(path) as f, concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for end, batch in batched_games(read_games(f, state["offset"]), batch_size):
+            pending.append((end, len(batch), pool.submit(mine_batch, batch)))
+            # Collect in input order so the checkpoint never skips a batch
+            while len(pending) >= workers * 2 or (pending and pending[0][2].done()):
+                collect(*pending.pop(0))
+        for entry in pending:
+            collect(*entry)
+
+    return totals["games"], totals["puzzles"], totals["unreadable"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mine chess puzzles from PGN game archives")
+    parser.add_argument("inputs", nargs="+", help="PGN files, optionally .gz/.bz2/.xz ('-' for stdin)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="puzzle database path")
+    parser.add_argument("--output", help="write puzzles to this JSON-lines file instead of the database")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    parser.add_argument("--batch-size", type=int, default=200, help="games per worker task")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    sink = JsonLinesSink(args.output) if args.output else StoreSink(PuzzleStore(args.db))
+    try:
+        for path in args.inputs:
+            start = time.perf_counter()
+            games, puzzles, unreadable = mine_archive(
+                path, sink, batch_size=args.batch_size, workers=args.workers, restart=args.restart
+            )
+            elapsed = time.perf_counter() - start
+            rate = games / elapsed if elapsed else 0
+            print(f"{path}: {puzzles} puzzles from {games} games ({unreadable} unreadable) "
+                  f"in {elapsed:.1f}s, {rate:.0f} games/s")
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
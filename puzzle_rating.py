@@ -0,0 +1,209 @@
+"""Puzzle ratings and non-repeating puzzle selection
+
+Both the user and every puzzle carry a Glicko rating. Each solved puzzle
+counts as a game between the two: solving it first time and quickly is a
+win for the user, needing several attempts or a long time is scored closer
+to a loss. Adaptive selection then serves puzzles from the rating band
+nearest the user's rating.
+
+Puzzles are never repeated until a whole bucket has been seen: each bucket
+is walked in the order of a keyed pseudo-random permutation of its slots,
+and only the walk's position is stored. A new key is used for every pass,
+so the order differs each time, and the state per bucket is three integers
+however large the bucket is.
+"""
+
+import getpass
+import hashlib
+import math
+import os
+import random
+import time
+
+from puzzle_store import DEFAULT_RATING, DEFAULT_RATING_DEVIATION, RATING_BAND
+from puzzle_verify import VERIFIER_VERSION
+
+Q = math.log(10) / 400
+
+# Rating deviation floors keep ratings responsive
+MIN_USER_DEVIATION = 30
+MIN_PUZZLE_DEVIATION = 50
+
+# How fast an idle user's rating becomes uncertain again, per day
+DEVIATION_GROWTH_PER_DAY = 15
+
+# Solving within this many seconds on the first attempt scores a full win
+TARGET_SOLVE_SECONDS = 30
+ATTEMPT_PENALTY = 0.3
+
+# Adaptive selection widens to neighbouring bands until it has this many puzzles
+ADAPTIVE_POOL = 50
+
+
+def g(deviation):
+    return 1 / math.sqrt(1 + 3 * (Q * deviation) ** 2 / math.pi ** 2)
+
+
+def expected_score(rating, opponent_rating, opponent_deviation):
+    return 1 / (1 + 10 ** (-g(opponent_deviation) * (rating - opponent_rating) / 400))
+
+
+def glicko_update(rating, deviation, opponent_rating, opponent_deviation, score):
+    """New (rating, deviation) after one game scored 0.0-1.0"""
+    g_value = g(opponent_deviation)
+    expected = expected_score(rating, opponent_rating, opponent_deviation)
+    d_squared = 1 / (Q ** 2 * g_value ** 2 * expected * (1 - expected))
+    precision = 1 / deviation ** 2 + 1 / d_squared
+    new_rating = rating + Q / precision * g_value * (score - expected)
+    return new_rating, math.sqrt(1 / precision)
+
+
+def solve_score(elapsed, attempts):
+    """Score of a solved puzzle from the time taken and moves submitted"""
+    score = max(0.0, 1 - ATTEMPT_PENALTY * (attempts - 1))
+    if elapsed > TARGET_SOLVE_SECONDS:
+        score *= max(0.5, TARGET_SOLVE_SECONDS / elapsed)
+    return score
+
+
+class KeyedPermutation:
+    """A pseudo-random permutation of range(size) chosen by key
+
+    A four round Feistel network over the smallest even number of bits that
+    covers size; values that land outside range(size) are fed through
+    again (cycle walking), which terminates because the network is a
+    permutation of the larger domain. Indexing is O(1) with no table.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, size, key):
+        self.size = size
+        self.key = key
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+
+    def round_value(self, round_index, value):
+        digest = hashlib.blake2b(
+            value.to_bytes(8, "little"), digest_size=8, key=self.key, salt=round_index.to_bytes(16, "little")
+        ).digest()
+        return int.from_bytes(digest, "little") & self.mask
+
+    def encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_index in range(self.ROUNDS):
+            left, right = right, left ^ self.round_value(round_index, right)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = self.encrypt(index)
+        while value >= self.size:
+            value = self.encrypt(value)
+        return value
+
+    def __len__(self):
+        return self.size
+
+
+class PuzzleSelector:
+    """Chooses the next puzzle for a user and keeps the ratings up to date
+
+    Walk state is kept per (user, bucket) in the puzzle database. A pass
+    over a bucket covers the puzzles it held when the pass began; puzzles
+    imported in the meantime join from the next pass.
+    """
+
+    def __init__(self, store, user=None, rng=random):
+        self.store = store
+        self.user = user or getpass.getuser()
+        self.rng = rng
+        secret = store.get_meta("sampler_secret")
+        if secret is None:
+            secret = os.urandom(16).hex()
+            store.set_meta("sampler_secret", secret)
+        self.secret = bytes.fromhex(secret)
+
+    def permutation(self, kind, key, epoch, size):
+        label = f"{self.user}\0{kind}\0{key}\0{epoch}".encode()
+        pass_key = hashlib.blake2b(label, digest_size=32, key=self.secret).digest()
+        return KeyedPermutation(size, pass_key)
+
+    def next_in_bucket(self, kind, key):
+        """Next puzzle of a bucket's current pass, None if the bucket is empty
+
+        Puzzles the current verifier found invalid are passed over; None as
+        well if that leaves nothing. Verdicts of older verifier versions
+        are ignored until the puzzles are checked again.
+        """
+        skipped = 0
+        while True:
+            with self.store.lock:
+                state = self.store.get_sampler_state(self.user, kind, key)
+                epoch, position, domain = state if state else (-1, 0, 0)
+                if position >= domain:
+                    epoch, position, domain = epoch + 1, 0, self.store.bucket_size(kind, key)
+                    if domain == 0:
+                        return None
+
+                slot = self.permutation(kind, key, epoch, domain)[position]
+                self.store.set_sampler_state(self.user, kind, key, epoch, position + 1, domain)
+            puzzle = self.store.bucket_puzzle(kind, key, slot)
+            if puzzle is None or not self.store.is_invalid(puzzle["id"], VERIFIER_VERSION):
+                return puzzle
+            skipped += 1
+            if skipped >= domain:
+                return None
+
+    def next_puzzle(self, difficulty=None):
+        """The next unseen puzzle of a difficulty, or of all puzzles"""
+        if difficulty is None:
+            return self.next_in_bucket("all", "")
+        return self.next_in_bucket("difficulty", difficulty)
+
+    def user_rating(self):
+        """(rating, deviation) with the deviation grown for the time since the last puzzle"""
+        row = self.store.get_user_rating(self.user)
+        if row is None:
+            return DEFAULT_RATING, DEFAULT_RATING_DEVIATION
+        rating, deviation, updated = row
+        idle_days = max(0.0, time.time() - updated) / 86400
+        deviation = math.sqrt(deviation ** 2 + DEVIATION_GROWTH_PER_DAY ** 2 * idle_days)
+        return rating, min(DEFAULT_RATING_DEVIATION, deviation)
+
+    def next_adaptive(self):
+        """The next puzzle from the rating bands nearest the user's rating"""
+        rating, _ = self.user_rating()
+        bands = sorted(self.store.bands(), key=lambda band: abs(band[0] + RATING_BAND / 2 - rating))
+        pool = []
+        total = 0
+        for band, count in bands:
+            pool.append((band, count))
+            total += count
+            if total >= ADAPTIVE_POOL:
+                break
+        if not pool:
+            return None
+
+        # Bands are drawn in proportion to their size
+        pick = self.rng.randrange(total)
+        for band, count in pool:
+            if pick < count:
+                return self.next_in_bucket("band", str(band))
+            pick -= count
+
+    def record_result(self, puzzle, elapsed, attempts):
+        """Rate a solved puzzle against the user, returns the user's new rating"""
+        score = solve_score(elapsed, attempts)
+        user_rating, user_deviation = self.user_rating()
+        puzzle_rating = puzzle.get("rating", DEFAULT_RATING)
+        puzzle_deviation = puzzle.get("rating_deviation", DEFAULT_RATING_DEVIATION)
+
+        new_user = glicko_update(user_rating, user_deviation, puzzle_rating, puzzle_deviation, score)
+        new_puzzle = glicko_update(puzzle_rating, puzzle_deviation, user_rating, user_deviation, 1 - score)
+
+        self.store.set_user_rating(self.user, new_user[0], max(MIN_USER_DEVIATION, new_user[1]), time.time())
+        self.store.set_puzzle_rating(puzzle["id"], new_puzzle[0], max(MIN_PUZZLE_DEVIATION, new_puzzle[1]))
+        return new_user[0]
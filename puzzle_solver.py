@@ -0,0 +1,338 @@
+"""Small alpha-beta solver for checking puzzle answers
+
+The solver is a negamax alpha-beta search with mate-distance scores, a
+material evaluation with capture quiescence, a transposition table and
+move ordering (table move, then checks, then captures by most valuable
+victim). It is tuned for what puzzles need: proving that a move keeps a
+forced mate, finding the longest defence against one, and comparing the
+material outcome of two moves.
+
+PuzzleSession drives a puzzle from the user's side. It accepts the stored
+solution line or any alternative that keeps the win, plays the opponent's
+replies, and follows multi-move lines.
+"""
+
+import re
+
+import chess
+
+MATE = 100000
+# Scores beyond this are mates
+MATE_BOUND = MATE - 1000
+INFINITY = MATE + 1
+
+PIECE_VALUES = {
+    chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300,
+    chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0
+}
+
+EXACT, LOWER, UPPER = range(3)
+
+NODE_LIMIT = 200000
+QUIESCENCE_DEPTH = 6
+
+MATE_PATTERN = re.compile(r"mate in (\d+)", re.IGNORECASE)
+
+# Alternatives to a non-mate solution are accepted if they mate this fast
+ALTERNATIVE_MATE_MOVES = 3
+# or gain at least WINNING_SCORE of material, and as much as the solution
+# to within ALTERNATIVE_MARGIN
+ALTERNATIVE_MARGIN = 50
+WINNING_SCORE = 200
+
+
+class SearchLimitReached(Exception):
+    pass
+
+
+class Solver:
+    """Alpha-beta search over one puzzle; keep an instance to reuse its table
+
+    node_limit applies to each query (mates_after, mate_in, best_defence,
+    move_value) on its own, so one long search does not use up the budget
+    of the judgements that follow it.
+    """
+
+    def __init__(self, node_limit=NODE_LIMIT):
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.table = {}
+
+    @staticmethod
+    def key(board):
+        # The same tuple of bitboards python-chess uses to detect
+        # repetitions, far cheaper than a Zobrist hash computed in Python
+        return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+                board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.turn,
+                board.clean_castling_rights(), board.ep_square if board.has_legal_en_passant() else None)
+
+    @staticmethod
+    def evaluate(board):
+        """Material balance from the side to move's point of view"""
+        score = 0
+        for piece_type, value in PIECE_VALUES.items():
+            score += value * (board.pieces_mask(piece_type, board.turn).bit_count()
+                              - board.pieces_mask(piece_type, not board.turn).bit_count())
+        return score
+
+    def count_node(self):
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise SearchLimitReached()
+
+    def ordered(self, board, moves, first=None):
+        """Moves in search order: first, checks, captures by victim value, the rest"""
+        def order(move):
+            if move == first:
+                return -INFINITY
+            board.push(move)
+            check = board.is_check()
+            board.pop()
+            victim = board.piece_type_at(move.to_square)
+            return -(10000 if check else 0) - (PIECE_VALUES[victim] if victim else 0)
+        return sorted(moves, key=order)
+
+    def search(self, board, depth, alpha, beta, ply):
+        self.count_node()
+
+        # No score can beat mating or being mated from here
+        alpha = max(alpha, -MATE + ply)
+        beta = min(beta, MATE - ply - 1)
+        if alpha >= beta:
+            return alpha
+
+        if depth <= 0:
+            return self.quiesce(board, alpha, beta, ply, QUIESCENCE_DEPTH)
+
+        key = self.key(board)
+        entry = self.table.get(key)
+        table_move = None
+        if entry:
+            entry_depth, value, flag, table_move = entry
+            value = from_table(value, ply)
+            if entry_depth >= depth and (
+                flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha)
+            ):
+                return value
+
+        moves = list(board.legal_moves)
+        if not moves:
+            return -MATE + ply if board.is_check() else 0
+
+        # With one move left, only a check can reach a mate score
+        checks_only = depth == 1 and alpha >= MATE_BOUND
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = None
+        for move in self.ordered(board, moves, table_move):
+            board.push(move)
+            try:
+                if checks_only and not board.is_check():
+                    continue
+                value = -self.search(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.pop()
+            if value > best:
+                best, best_move = value, move
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+
+        if best_move is None:
+            best = original_alpha
+        flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.table[key] = (depth, to_table(best, ply), flag, best_move)
+        return best
+
+    def quiesce(self, board, alpha, beta, ply, depth):
+        self.count_node()
+        if board.is_check():
+            moves = list(board.legal_moves)
+            if not moves:
+                return -MATE + ply
+        else:
+            moves = None
+
+        # Past the horizon neither side can still reach a mate score
+        if alpha >= MATE_BOUND:
+            return alpha
+        if beta <= -MATE_BOUND:
+            return beta
+
+        if moves is None:
+            stand = self.evaluate(board)
+            if stand >= beta or depth <= 0:
+                return stand
+            alpha = max(alpha, stand)
+            best = stand
+            moves = self.ordered(board, board.generate_legal_captures())
+        else:
+            if depth <= 0:
+                return self.evaluate(board)
+            best = -INFINITY
+            moves = self.ordered(board, moves)
+
+        for move in moves:
+            board.push(move)
+            try:
+                value = -self.quiesce(board, -beta, -alpha, ply + 1, depth - 1)
+            finally:
+                board.pop()
+            if value > best:
+                best = value
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+        return best
+
+    def mates_after(self, board, move, moves):
+        """True if move forces mate within moves moves, counting itself"""
+        self.nodes = 0
+        board.push(move)
+        try:
+            if board.is_checkmate():
+                return True
+            if moves <= 1 or board.is_game_over():
+                return False
+            # The opponent is to move, one ply below the mover
+            target = MATE - (2 * moves - 1)
+            value = self.search(board, 2 * (moves - 1), -target, -target + 1, 1)
+            return value <= -target
+        finally:
+            board.pop()
+
+    def mate_in(self, board, max_moves):
+        """Moves in the side to move's shortest forced mate, up to max_moves, or None"""
+        self.nodes = 0
+        return self._mate_in(board, max_moves)
+
+    def _mate_in(self, board, max_moves):
+        for moves in range(1, max_moves + 1):
+            target = MATE - (2 * moves - 1)
+            if self.search(board, 2 * moves - 1, target - 1, target, 0) >= target:
+                return moves
+        return None
+
+    def best_defence(self, board, moves, preferred=None):
+        """The reply that puts off the opponent's mate in moves the longest"""
+        self.nodes = 0
+        best = None
+        best_delay = -1
+        for reply in self.ordered(board, list(board.legal_moves), preferred):
+            board.push(reply)
+            try:
+                delay = self._mate_in(board, moves)
+            finally:
+                board.pop()
+            if delay is None:
+                return reply
+            if delay > best_delay:
+                best, best_delay = reply, delay
+        return best
+
+    def move_value(self, board, move, depth=1):
+        """Material outcome of move after depth replies and quiescence"""
+        self.nodes = 0
+        board.push(move)
+        try:
+            return -self.search(board, depth, -INFINITY, INFINITY, 1)
+        finally:
+            board.pop()
+
+
+def to_table(value, ply):
+    # Mate scores are stored relative to the node, not the root
+    if value >= MATE_BOUND:
+        return value + ply
+    if value <= -MATE_BOUND:
+        return value - ply
+    return value
+
+
+def from_table(value, ply):
+    if value >= MATE_BOUND:
+        return value - ply
+    if value <= -MATE_BOUND:
+        return value + ply
+    return value
+
+
+class PuzzleSession:
+    """The state of one puzzle being solved on a board
+
+    The solution is a line of UCI moves alternating between the user and
+    the opponent; most puzzles are a single move. A move is accepted if it
+    is the next move of the line, or if it keeps a forced mate (for "Mate in
+    N" puzzles), or if it mates, or wins material and gains as much as the
+    line's move (for other puzzles). Gains are counted from the material
+    balance before the move, so being ahead already does not make every
+    move acceptable. Once the user leaves the line, mate puzzles
+    continue with the solver choosing the longest defence and other puzzles
+    are solved. submit() pushes the accepted move and the reply onto the
+    board.
+    """
+
+    def __init__(self, board, puzzle, solver=None):
+        self.board = board
+        self.line = [chess.Move.from_uci(uci) for uci in puzzle["solution"].split()]
+        if not self.line:
+            raise ValueError("empty solution")
+        match = MATE_PATTERN.search(puzzle.get("description", ""))
+        self.moves_left = int(match.group(1)) if match else None
+        self.solver = solver or Solver()
+        self.index = 0
+        self.on_line = True
+
+    def expected(self):
+        return self.line[self.index] if self.on_line and self.index < len(self.line) else None
+
+    def is_alternative(self, move):
+        expected = self.expected()
+        try:
+            if self.moves_left:
+                return self.solver.mates_after(self.board, move, self.moves_left)
+            if expected is None:
+                return False
+            for moves in range(1, ALTERNATIVE_MATE_MOVES + 1):
+                if self.solver.mates_after(self.board, move, moves):
+                    self.moves_left = moves
+                    return True
+            before = self.solver.evaluate(self.board)
+            target = self.solver.move_value(self.board, expected) - before
+            gain = self.solver.move_value(self.board, move) - before
+            return gain >= WINNING_SCORE and gain >= target - ALTERNATIVE_MARGIN
+        except SearchLimitReached:
+            return False
+
+    def submit(self, move):
+        """Returns ("wrong", None), ("continue", reply SAN) or ("solved", None)"""
+        if move == self.expected():
+            self.index += 1
+        elif self.is_alternative(move):
+            self.on_line = False
+        else:
+            return "wrong", None
+
+        self.board.push(move)
+        if self.moves_left:
+            self.moves_left -= 1
+        if self.board.is_game_over():
+            return "solved", None
+
+        if self.on_line and self.index < len(self.line):
+            reply = self.line[self.index]
+            self.index += 1
+        elif self.moves_left:
+            self.on_line = False
+            try:
+                reply = self.solver.best_defence(self.board, self.moves_left)
+            except SearchLimitReached:
+                reply = next(iter(self.board.legal_moves))
+        else:
+            return "solved", None
+
+        san = self.board.san(reply)
+        self.board.push(reply)
+        return "continue", san
@@ -0,0 +1,580 @@
+import sqlite3
+import threading
+import random
+import json
+import os
+import sys
+
+import chess
+
+from position_index import PositionIndex, position_hash
+
+# Sample puzzles - seeded into every new store
+BUILTIN_PUZZLES = [
+    {
+        "fen": "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 1",
+        "description": "Find the best move for White",
+        "solution": "f3e5",  # Knight takes e5
+        "difficulty": "easy"
+    },
+    {
+        "fen": "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 1",
+        "description": "Find the fork",
+        "solution": "f3g5",  # Knight to g5 fork
+        "difficulty": "easy"
+    },
+    {
+        "fen": "r1bqkbnr/pppp1ppp/2n5/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 1",
+        "description": "Find the best defense",
+        "solution": "g7g6",  # Blocks the mate on f7 and attacks the queen
+        "difficulty": "medium"
+    },
+    {
+        "fen": "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 0 1",
+        "description": "Mate in 1",
+        "solution": "h5f7",  # Queen takes f7, checkmate
+        "difficulty": "easy"
+    },
+    {
+        "fen": "3r1rk1/pp3ppp/2p5/8/3P4/8/PPP2PPP/R3K2R w KQ - 0 1",
+        "description": "Find the best move",
+        "solution": "e1c1",  # Castle queenside
+        "difficulty": "medium"
+    },
+    {
+        "fen": "r1bq1rk1/pp2ppbp/2np1np1/8/2BNP3/2N1BP2/PPP3PP/R2QK2R w KQ - 0 1",
+        "description": "Find the best move for White",
+        "solution": "d4f5",  # Knight to f5
+        "difficulty": "medium"
+    },
+    {
+        "fen": "r4rk1/pp1n1ppp/2p1p3/q2p4/8/P1NPP1P1/1PPQ1PBP/R3K2R w KQ - 0 1",
+        "description": "Find the best move for White",
+        "solution": "d3d4",  # Opening the diagonal for the bishop
+        "difficulty": "medium"
+    },
+    {
+        "fen": "r1b1kb1r/pp3ppp/2n1pn2/q1pp4/3P4/P1N1PN2/1PP1BPPP/R1BQK2R w KQkq - 0 1",
+        "description": "Find a strong developing move",
+        "solution": "c1d2",  # Bishop to d2, breaking the pin on the knight
+        "difficulty": "medium"
+    },
+    {
+        "fen": "r3kb1r/ppp2ppp/2n1b3/3q4/3pN3/8/PPP2PPP/RNBQR1K1 w kq - 0 1",
+        "description": "Find the winning tactic",
+        "solution": "e4d6",  # Knight fork
+        "difficulty": "easy"
+    },
+    {
+        "fen": "2r3k1/pp2ppbp/3p2p1/3P4/3b4/P4N2/1P3PPP/2B1R1K1 w - - 0 1",
+        "description": "Find the best move for White",
+        "solution": "c1h6",  # Bishop to h6
+        "difficulty": "hard"
+    }
+]
+
+# Broken built-in puzzles seeded by earlier versions, (fen, solution) -> index
+# of the puzzle that replaces them in BUILTIN_PUZZLES
+REPLACED_BUILTINS = {
+    ("r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 1", "f3d5"): 0,
+    ("r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNB1K2R b KQkq - 0 1", "d8f7"): 2,
+    ("r3k2r/pp3ppp/2p5/4Pb2/2B2P2/8/PPP3PP/R3K2R w KQkq - 0 1", "c4f7"): 3,
+    ("r1b1kb1r/pp3ppp/2n1pn2/q1pp4/3P4/P1N1PN2/1PP1BPPP/R1BQK2R w KQkq - 0 1", "c1g5"): 7,
+}
+
+DEFAULT_DB_PATH = "chess_puzzles.db"
+LEGACY_JSON_PATH = "chess_puzzles.json"
+
+# Starting rating for puzzles that come without one
+DIFFICULTY_RATINGS = {"easy": 1200, "medium": 1600, "hard": 2000}
+DEFAULT_RATING = 1500
+DEFAULT_RATING_DEVIATION = 350
+
+# Width of the rating bands puzzles are indexed by for adaptive selection
+RATING_BAND = 100
+
+PUZZLE_COLUMNS = "id, fen, description, solution, difficulty, themes, rating, rating_deviation"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS puzzles (
+    id INTEGER PRIMARY KEY,
+    fen TEXT NOT NULL,
+    description TEXT NOT NULL,
+    solution TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    themes TEXT NOT NULL DEFAULT '',
+    rating REAL NOT NULL DEFAULT 1500,
+    rating_deviation REAL NOT NULL DEFAULT 350,
+    position_hash INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS puzzles_position ON puzzles (position_hash);
+
+-- Every bucket (a difficulty, a theme or a rating band) numbers its puzzles 0..count-1, so a
+-- uniform random pick is one B-tree lookup on (kind, key, slot).
+CREATE TABLE IF NOT EXISTS bucket_slots (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    puzzle_id INTEGER NOT NULL,
+    PRIMARY KEY (kind, key, slot)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS bucket_counts (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_ratings (
+    user TEXT PRIMARY KEY,
+    rating REAL NOT NULL,
+    rating_deviation REAL NOT NULL,
+    updated REAL NOT NULL
+);
+
+-- Position of a user's walk through the keyed permutation of one bucket
+CREATE TABLE IF NOT EXISTS sampler_state (
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    domain INTEGER NOT NULL,
+    PRIMARY KEY (user, kind, key)
+) WITHOUT ROWID;
+
+-- Results of puzzle_verify.py, one row per distinct puzzle
+CREATE TABLE IF NOT EXISTS verification (
+    position_hash INTEGER NOT NULL,
+    solution TEXT NOT NULL,
+    description TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    PRIMARY KEY (position_hash, solution, description)
+) WITHOUT ROWID;
+"""
+
+
+def puzzle_problem(puzzle):
+    """Why a puzzle dict from an outside source cannot be stored, or None"""
+    if not isinstance(puzzle, dict):
+        return "not an object"
+    for key in ("fen", "solution", "difficulty"):
+        if not isinstance(puzzle.get(key), str) or not puzzle[key]:
+            return f"missing {key!r}"
+    for key in ("description", "themes"):
+        if not isinstance(puzzle.get(key, ""), (str, list)):
+            return f"bad {key!r}"
+    return None
+
+
+def rating_band(rating):
+    return int(rating // RATING_BAND) * RATING_BAND
+
+
+class PuzzleStore:
+    """Indexed on-disk puzzle database backed by SQLite
+
+    Puzzles are never held in memory as a whole; each lookup reads a single
+    row, and random selection by difficulty or theme is O(log n). Every
+    puzzle carries the Zobrist hash of its position, and a puzzle whose
+    position is already in the store is skipped when added. Puzzles that
+    puzzle_verify.py found invalid stay stored but are reported by
+    is_invalid(), so selection can pass over them.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, legacy_json=LEGACY_JSON_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.positions = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.migrate()
+        self.conn.executescript(SCHEMA)
+
+        if self.count() == 0:
+            self.add_puzzles(BUILTIN_PUZZLES, meta={"builtins_repaired": 1})
+        else:
+            self.repair_builtin_puzzles()
+        if legacy_json:
+            self.import_legacy_json(legacy_json)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def migrate(self):
+        """Bring databases created by older versions up to the current schema"""
+        with self.lock, self.conn:
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(puzzles)")]
+            if not columns:
+                return
+            if "rating" not in columns:
+                self.add_rating_columns()
+            if "position_hash" not in columns:
+                self.add_position_hashes()
+
+    def add_rating_columns(self):
+        with self.lock, self.conn:
+            self.conn.execute(f"ALTER TABLE puzzles ADD COLUMN rating REAL NOT NULL DEFAULT {DEFAULT_RATING}")
+            self.conn.execute(
+                f"ALTER TABLE puzzles ADD COLUMN rating_deviation REAL NOT NULL DEFAULT {DEFAULT_RATING_DEVIATION}"
+            )
+            for difficulty, rating in DIFFICULTY_RATINGS.items():
+                self.conn.execute("UPDATE puzzles SET rating = ? WHERE difficulty = ?", (rating, difficulty))
+
+            # Index the existing puzzles by rating band
+            counts = {}
+            rows = self.conn.execute("SELECT id, rating FROM puzzles ORDER BY id")
+            slots = []
+            for puzzle_id, rating in rows:
+                band = str(rating_band(rating))
+                slots.append(("band", band, counts.get(band, 0), puzzle_id))
+                counts[band] = counts.get(band, 0) + 1
+            self.conn.executemany("INSERT INTO bucket_slots (kind, key, slot, puzzle_id) VALUES (?, ?, ?, ?)", slots)
+            self.conn.executemany(
+                "INSERT INTO bucket_counts (kind, key, count) VALUES ('band', ?, ?)", list(counts.items())
+            )
+
+    def add_position_hashes(self):
+        # Puzzles already stored twice are kept; ids must stay dense
+        with self.lock, self.conn:
+            self.conn.execute("ALTER TABLE puzzles ADD COLUMN position_hash INTEGER")
+            for batch in self.iter_batches():
+                updates = []
+                for puzzle in batch:
+                    try:
+                        updates.append((position_hash(chess.Board(puzzle["fen"])), puzzle["id"]))
+                    except ValueError:
+                        pass
+                self.conn.executemany("UPDATE puzzles SET position_hash = ? WHERE id = ?", updates)
+
+    def repair_builtin_puzzles(self):
+        """Replace the broken built-in puzzles of older databases, once"""
+        if self.get_meta("builtins_repaired"):
+            return
+        with self.lock, self.conn:
+            for (fen, solution), index in REPLACED_BUILTINS.items():
+                puzzle = BUILTIN_PUZZLES[index]
+                position = position_hash(chess.Board(puzzle["fen"]))
+                # Left alone if the new position was imported separately
+                duplicate = self.conn.execute(
+                    "SELECT 1 FROM puzzles WHERE position_hash = ? AND fen != ?", (position, fen)
+                ).fetchone()
+                if duplicate:
+                    continue
+                self.conn.execute(
+                    "UPDATE puzzles SET fen = ?, description = ?, solution = ?, position_hash = ?, "
+                    "rating = ?, rating_deviation = ? WHERE fen = ? AND solution = ?",
+                    (puzzle["fen"], puzzle["description"], puzzle["solution"], position,
+                     DIFFICULTY_RATINGS[puzzle["difficulty"]], DEFAULT_RATING_DEVIATION, fen, solution)
+                )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('builtins_repaired', '1')")
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def import_legacy_json(self, path):
+        """Import chess_puzzles.json once per modification of the file"""
+        if not os.path.exists(path):
+            return 0
+
+        mtime = str(os.path.getmtime(path))
+        if self.get_meta("legacy_json_mtime") == mtime:
+            return 0
+
+        try:
+            with open(path, "r") as f:
+                puzzles = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read {path}: {e}", file=sys.stderr)
+            return 0
+        if not isinstance(puzzles, list):
+            print(f"Could not read {path}: expected a list of puzzles", file=sys.stderr)
+            return 0
+
+        valid = []
+        for index, puzzle in enumerate(puzzles):
+            problem = puzzle_problem(puzzle)
+            if problem:
+                print(f"Skipping puzzle {index} in {path}: {problem}", file=sys.stderr)
+            else:
+                valid.append(puzzle)
+
+        added = self.add_puzzles(valid)
+        self.set_meta("legacy_json_mtime", mtime)
+        return added
+
+    def add_puzzles(self, puzzles, meta=None):
+        """Insert puzzles in a single transaction and index them by bucket
+
+        Puzzles whose position is already stored, or whose FEN cannot be
+        read, are skipped; returns the number added. Entries of meta are
+        written in the same transaction, for callers that checkpoint their
+        progress alongside the puzzles.
+        """
+        added = 0
+        with self.lock:
+            positions = self.position_index()
+            new_positions = set()
+            with self.conn:
+                cursor = self.conn.cursor()
+                counts = {}
+                for puzzle in puzzles:
+                    position = puzzle.get("position_hash")
+                    if position is None:
+                        try:
+                            position = position_hash(chess.Board(puzzle["fen"]))
+                        except ValueError as e:
+                            print(f"Skipping puzzle with bad FEN {puzzle['fen']!r}: {e}", file=sys.stderr)
+                            continue
+                    if position in new_positions or position in positions:
+                        continue
+                    new_positions.add(position)
+
+                    themes = puzzle.get("themes", "")
+                    if not isinstance(themes, str):
+                        themes = " ".join(themes)
+                    rating = puzzle.get("rating") or DIFFICULTY_RATINGS.get(puzzle["difficulty"], DEFAULT_RATING)
+                    rating_deviation = puzzle.get("rating_deviation") or DEFAULT_RATING_DEVIATION
+                    cursor.execute(
+                        "INSERT INTO puzzles "
+                        "(fen, description, solution, difficulty, themes, rating, rating_deviation, position_hash) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (puzzle["fen"], puzzle.get("description", ""), puzzle["solution"], puzzle["difficulty"], themes,
+                         rating, rating_deviation, position)
+                    )
+                    puzzle_id = cursor.lastrowid
+
+                    # A puzzle stays in the band of its initial rating
+                    buckets = [("difficulty", puzzle["difficulty"]), ("band", str(rating_band(rating)))]
+                    buckets.extend(("theme", theme) for theme in themes.split())
+                    for bucket in buckets:
+                        if bucket not in counts:
+                            counts[bucket] = self._bucket_count(cursor, *bucket)
+                        cursor.execute(
+                            "INSERT INTO bucket_slots (kind, key, slot, puzzle_id) VALUES (?, ?, ?, ?)",
+                            (bucket[0], bucket[1], counts[bucket], puzzle_id)
+                        )
+                        counts[bucket] += 1
+                    added += 1
+
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO bucket_counts (kind, key, count) VALUES (?, ?, ?)",
+                    [(kind, key, count) for (kind, key), count in counts.items()]
+                )
+                if meta:
+                    cursor.executemany(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        [(key, str(value)) for key, value in meta.items()]
+                    )
+            # Only once the transaction has committed
+            positions.update(new_positions)
+        return added
+
+    def position_index(self):
+        """In-memory index of every stored position, loaded on first use"""
+        with self.lock:
+            if self.positions is None:
+                cursor = self.conn.execute(
+                    "SELECT position_hash FROM puzzles WHERE position_hash IS NOT NULL ORDER BY position_hash"
+                )
+
+                def chunks():
+                    while True:
+                        rows = cursor.fetchmany(100000)
+                        if not rows:
+                            return
+                        yield [row[0] for row in rows]
+
+                self.positions = PositionIndex.from_sorted(chunks())
+            return self.positions
+
+    def has_position(self, board):
+        """True if a puzzle starts from this position (or a transposition of it)"""
+        return position_hash(board) in self.position_index()
+
+    def find_position(self, board):
+        """The puzzle starting from this position, or None; reads the on-disk index only"""
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {PUZZLE_COLUMNS} FROM puzzles WHERE position_hash = ? LIMIT 1", (position_hash(board),)
+            ).fetchone()
+        return self.row_to_puzzle(row) if row else None
+
+    def _bucket_count(self, cursor, kind, key):
+        row = cursor.execute(
+            "SELECT count FROM bucket_counts WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def count(self, difficulty=None, theme=None):
+        """Number of puzzles overall, or in one difficulty or theme bucket"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            if difficulty is not None:
+                return self._bucket_count(cursor, "difficulty", difficulty)
+            if theme is not None:
+                return self._bucket_count(cursor, "theme", theme)
+            row = cursor.execute("SELECT MAX(id) FROM puzzles").fetchone()
+            return row[0] or 0
+
+    def difficulties(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key FROM bucket_counts WHERE kind = 'difficulty' AND count > 0"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def row_to_puzzle(row):
+        return {
+            "id": row[0],
+            "fen": row[1],
+            "description": row[2],
+            "solution": row[3],
+            "difficulty": row[4],
+            "themes": row[5],
+            "rating": row[6],
+            "rating_deviation": row[7]
+        }
+
+    def get(self, puzzle_id):
+        """Fetch a single puzzle dict by id"""
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {PUZZLE_COLUMNS} FROM puzzles WHERE id = ?",
+                (puzzle_id,)
+            ).fetchone()
+        return self.row_to_puzzle(row) if row else None
+
+    def is_invalid(self, puzzle_id, version):
+        """Whether puzzle_verify.py at the given verifier version found this puzzle broken"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM puzzles JOIN verification USING (position_hash, solution, description) "
+                "WHERE id = ? AND status = 'invalid' AND version = ?",
+                (puzzle_id, version)
+            ).fetchone()
+        return row is not None
+
+    def iter_batches(self, batch_size=10000):
+        """Yield every puzzle in id order, batch_size puzzles at a time"""
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT {PUZZLE_COLUMNS} FROM puzzles WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [self.row_to_puzzle(row) for row in rows]
+
+    def iter_tables(self, batch_size=10000):
+        """Like iter_batches, but each batch is a compact PuzzleTable"""
+        from puzzle_table import PuzzleTable
+        for batch in self.iter_batches(batch_size):
+            yield PuzzleTable.from_puzzles(batch)
+
+    def random_puzzle(self, difficulty=None, theme=None, rng=random):
+        """Pick a uniformly random puzzle, optionally from one bucket
+
+        Returns None if the requested bucket is empty.
+        """
+        if difficulty is None and theme is None:
+            total = self.count()
+            if total == 0:
+                return None
+            # Ids are dense because puzzles are only ever appended
+            return self.get(rng.randrange(total) + 1)
+
+        kind, key = ("difficulty", difficulty) if difficulty is not None else ("theme", theme)
+        with self.lock:
+            cursor = self.conn.cursor()
+            total = self._bucket_count(cursor, kind, key)
+            if total == 0:
+                return None
+            row = cursor.execute(
+                "SELECT puzzle_id FROM bucket_slots WHERE kind = ? AND key = ? AND slot = ?",
+                (kind, key, rng.randrange(total))
+            ).fetchone()
+        return self.get(row[0])
+
+    def bucket_puzzle(self, kind, key, slot):
+        """The puzzle at a slot of a bucket; kind "all" addresses every puzzle by id"""
+        if kind == "all":
+            return self.get(slot + 1)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT puzzle_id FROM bucket_slots WHERE kind = ? AND key = ? AND slot = ?",
+                (kind, key, slot)
+            ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def bucket_size(self, kind, key):
+        if kind == "all":
+            return self.count()
+        with self.lock:
+            return self._bucket_count(self.conn.cursor(), kind, key)
+
+    def bands(self):
+        """Non-empty rating bands as sorted (band rating, puzzle count) pairs"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, count FROM bucket_counts WHERE kind = 'band' AND count > 0"
+            ).fetchall()
+        return sorted((int(key), count) for key, count in rows)
+
+    def set_puzzle_rating(self, puzzle_id, rating, rating_deviation):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE puzzles SET rating = ?, rating_deviation = ? WHERE id = ?",
+                (rating, rating_deviation, puzzle_id)
+            )
+
+    def get_user_rating(self, user):
+        """(rating, rating deviation, last update timestamp) or None"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT rating, rating_deviation, updated FROM user_ratings WHERE user = ?", (user,)
+            ).fetchone()
+
+    def set_user_rating(self, user, rating, rating_deviation, updated):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO user_ratings (user, rating, rating_deviation, updated) VALUES (?, ?, ?, ?)",
+                (user, rating, rating_deviation, updated)
+            )
+
+    def get_sampler_state(self, user, kind, key):
+        """(epoch, position, domain) or None"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT epoch, position, domain FROM sampler_state WHERE user = ? AND kind = ? AND key = ?",
+                (user, kind, key)
+            ).fetchone()
+
+    def set_sampler_state(self, user, kind, key, epoch, position, domain):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sampler_state (user, kind, key, epoch, position, domain) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user, kind, key, epoch, position, domain)
+            )
@@ -0,0 +1,282 @@
+"""Compact in-memory puzzle collections
+
+A PuzzleTable keeps puzzles in columns instead of one dict per puzzle:
+
+    occupied     8 bytes   occupancy bitboard of the position
+    state        2 bytes   side to move, castling rights, en passant file
+    blob         ~18 bytes one 4-bit code per piece, in square order, then
+                           the solution line as 16-bit moves
+    description, difficulty, themes
+                 1-2 bytes each, codes into tables of interned strings
+    rating, rating_deviation
+                 2 bytes each
+
+Offsets into the blob are kept for every 16th puzzle only; the records in
+between are skipped by counting pieces and reading moves up to the one
+flagged as the last of its line. Ids cost nothing while they are
+consecutive, as they are in the puzzle store. A typical puzzle takes under
+40 bytes, against well over 1 KB as a dict of strings.
+
+Boards are built straight from the bitboards when asked for, without
+parsing a FEN. Half-move and full-move counters are not kept; FENs read
+back from a table end in "0 1". Puzzles that cannot be packed (a bad FEN, a
+Chess960 position, an unreadable solution) are kept as they are, so a
+table holds every puzzle it is given.
+"""
+
+import array
+
+import chess
+
+CHECKPOINT_EVERY = 16
+
+# Piece codes: piece type in the low 3 bits, bit 3 set for black
+BLACK_PIECE = 8
+
+# Move codes: from square, to square, promotion piece type, end of line
+LAST_MOVE = 1 << 15
+
+CASTLING_SQUARES = (chess.H1, chess.A1, chess.H8, chess.A8)
+STANDARD_CASTLING = chess.BB_H1 | chess.BB_A1 | chess.BB_H8 | chess.BB_A8
+
+
+class CodeColumn:
+    """A column of repeated strings, stored as small integer codes
+
+    Codes start at one byte each and the column widens to two or four
+    bytes only once there are that many distinct values.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self.data = array.array("B")
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.values[self.data[index]]
+
+    def append(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            if code >= 1 << (8 * self.data.itemsize):
+                self.data = array.array("H" if code < 1 << 16 else "I", self.data)
+        self.data.append(code)
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + sum(len(value) for value in self.values)
+
+
+def encode_move(move, last):
+    code = move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+    return code | LAST_MOVE if last else code
+
+
+def decode_move(code):
+    promotion = code >> 12 & 7
+    return chess.Move(code & 63, code >> 6 & 63, promotion or None)
+
+
+class PuzzleTable:
+    """Column-oriented puzzle collection; table[i] rebuilds the puzzle dict"""
+
+    def __init__(self):
+        self.occupied = array.array("Q")
+        self.state = array.array("H")
+        self.blob = bytearray()
+        self.offsets = array.array("I")  # blob offset of every CHECKPOINT_EVERY-th puzzle
+        self.description = CodeColumn()
+        self.difficulty = CodeColumn()
+        self.themes = CodeColumn()
+        self.rating = array.array("H")
+        self.rating_deviation = array.array("H")
+        self.first_id = None
+        self.ids = None   # only once ids stop being consecutive
+        self.raw = {}     # index -> puzzle dict that could not be packed
+
+    @classmethod
+    def from_puzzles(cls, puzzles):
+        table = cls()
+        table.extend(puzzles)
+        return table
+
+    @classmethod
+    def from_store(cls, store, batch_size=10000):
+        """Load every puzzle of a PuzzleStore"""
+        table = cls()
+        for batch in store.iter_batches(batch_size):
+            table.extend(batch)
+        return table
+
+    def __len__(self):
+        return len(self.occupied)
+
+    def extend(self, puzzles):
+        for puzzle in puzzles:
+            self.append(puzzle)
+
+    def append(self, puzzle):
+        index = len(self.occupied)
+        if index % CHECKPOINT_EVERY == 0:
+            self.offsets.append(len(self.blob))
+        self.append_id(puzzle.get("id", index + 1))
+
+        try:
+            occupied, state, record = self.pack(puzzle)
+        except (ValueError, TypeError, KeyError):
+            # An empty board marks a record with nothing in the blob
+            occupied, state, record = 0, 0, b""
+            self.raw[index] = puzzle
+        self.occupied.append(occupied)
+        self.state.append(state)
+        self.blob += record
+
+        self.description.append(puzzle.get("description", ""))
+        self.difficulty.append(puzzle.get("difficulty", ""))
+        self.themes.append(puzzle.get("themes", ""))
+        self.rating.append(max(0, min(0xFFFF, round(puzzle.get("rating", 1500)))))
+        self.rating_deviation.append(max(0, min(0xFFFF, round(puzzle.get("rating_deviation", 350)))))
+
+    def append_id(self, puzzle_id):
+        index = len(self.occupied)
+        if self.first_id is None:
+            self.first_id = puzzle_id
+        if self.ids is None and puzzle_id != self.first_id + index:
+            self.ids = array.array("Q", range(self.first_id, self.first_id + index))
+        if self.ids is not None:
+            self.ids.append(puzzle_id)
+
+    @staticmethod
+    def pack(puzzle):
+        """(occupied, state, blob record) for a puzzle dict, raises ValueError"""
+        board = chess.Board(puzzle["fen"])
+        if board.castling_rights & ~STANDARD_CASTLING or not board.occupied:
+            raise ValueError("only standard positions are packed")
+        line = [chess.Move.from_uci(uci) for uci in puzzle["solution"].split()]
+        if not line or any(not move for move in line):
+            raise ValueError("empty or null move in solution")
+
+        state = int(board.turn)
+        for bit, square in enumerate(CASTLING_SQUARES):
+            if board.castling_rights & chess.BB_SQUARES[square]:
+                state |= 2 << bit
+        if board.ep_square is not None:
+            state |= (8 | chess.square_file(board.ep_square)) << 5
+
+        codes = []
+        for square in chess.scan_forward(board.occupied):
+            code = board.piece_type_at(square)
+            if not board.occupied_co[chess.WHITE] & chess.BB_SQUARES[square]:
+                code |= BLACK_PIECE
+            codes.append(code)
+        if len(codes) % 2:
+            codes.append(0)
+        record = bytearray(codes[i] | codes[i + 1] << 4 for i in range(0, len(codes), 2))
+        for i, move in enumerate(line):
+            record += encode_move(move, i == len(line) - 1).to_bytes(2, "little")
+        return board.occupied, state, bytes(record)
+
+    def record_offset(self, index):
+        """Blob offset of a puzzle's record, from the nearest checkpoint"""
+        offset = self.offsets[index // CHECKPOINT_EVERY]
+        for skipped in range(index - index % CHECKPOINT_EVERY, index):
+            occupied = self.occupied[skipped]
+            if not occupied:
+                continue
+            offset += (occupied.bit_count() + 1) // 2
+            while int.from_bytes(self.blob[offset:offset + 2], "little") & LAST_MOVE == 0:
+                offset += 2
+            offset += 2
+        return offset
+
+    def id_at(self, index):
+        return self.ids[index] if self.ids is not None else self.first_id + index
+
+    def board(self, index):
+        """A fresh chess.Board for a puzzle's position; raises ValueError for a bad FEN"""
+        if index in self.raw:
+            return chess.Board(self.raw[index]["fen"])
+        occupied = self.occupied[index]
+        offset = self.record_offset(index)
+
+        masks = [0] * 7
+        black = 0
+        for i, square in enumerate(chess.scan_forward(occupied)):
+            code = self.blob[offset + i // 2] >> (4 * (i % 2)) & 15
+            bit = chess.BB_SQUARES[square]
+            masks[code & 7] |= bit
+            if code & BLACK_PIECE:
+                black |= bit
+
+        board = chess.Board(None)
+        board.pawns, board.knights, board.bishops = masks[chess.PAWN], masks[chess.KNIGHT], masks[chess.BISHOP]
+        board.rooks, board.queens, board.kings = masks[chess.ROOK], masks[chess.QUEEN], masks[chess.KING]
+        board.occupied_co[chess.WHITE] = occupied & ~black
+        board.occupied_co[chess.BLACK] = black
+        board.occupied = occupied
+
+        state = self.state[index]
+        board.turn = bool(state & 1)
+        for bit, square in enumerate(CASTLING_SQUARES):
+            if state & 2 << bit:
+                board.castling_rights |= chess.BB_SQUARES[square]
+        if state & 8 << 5:
+            rank = 5 if board.turn == chess.WHITE else 2
+            board.ep_square = chess.square(state >> 5 & 7, rank)
+        return board
+
+    def line(self, index):
+        """The solution line as a list of chess.Move"""
+        if index in self.raw:
+            return [chess.Move.from_uci(uci) for uci in self.raw[index]["solution"].split()]
+        offset = self.record_offset(index) + (self.occupied[index].bit_count() + 1) // 2
+        moves = []
+        while True:
+            code = int.from_bytes(self.blob[offset:offset + 2], "little")
+            moves.append(decode_move(code))
+            if code & LAST_MOVE:
+                return moves
+            offset += 2
+
+    def solution(self, index):
+        if index in self.raw:
+            return self.raw[index]["solution"]
+        return " ".join(move.uci() for move in self.line(index))
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("puzzle index out of range")
+        index %= len(self)
+        if index in self.raw:
+            puzzle = dict(self.raw[index])
+            puzzle.setdefault("id", self.id_at(index))
+            return puzzle
+        return {
+            "id": self.id_at(index),
+            "fen": self.board(index).fen(),
+            "description": self.description[index],
+            "solution": self.solution(index),
+            "difficulty": self.difficulty[index],
+            "themes": self.themes[index],
+            "rating": float(self.rating[index]),
+            "rating_deviation": float(self.rating_deviation[index])
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def nbytes(self):
+        """Memory held by the columns, not counting Python object headers"""
+        total = len(self.blob)
+        for column in (self.occupied, self.state, self.offsets, self.rating, self.rating_deviation):
+            total += column.itemsize * len(column)
+        for column in (self.description, self.difficulty, self.themes):
+            total += column.nbytes()
+        if self.ids is not None:
+            total += self.ids.itemsize * len(self.ids)
+        return total
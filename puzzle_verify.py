@@ -0,0 +1,198 @@
+"""Batch puzzle verifier
+
+Checks every puzzle in the puzzle database without a display: the position
+must be valid, every move of the solution line must be legal, and puzzles
+described as "Mate in N" must really force mate in N with the given first
+move. Work is
+spread across all cores, and results are cached in the database keyed by the
+position's Zobrist hash, so re-running over a large collection only verifies
+puzzles that were added or changed since the last run.
+
+    python puzzle_verify.py --report broken_puzzles.jsonl
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import chess
+
+from position_index import position_hash
+from puzzle_solver import Solver, SearchLimitReached, MATE_PATTERN
+from puzzle_store import PuzzleStore, DEFAULT_DB_PATH
+
+# Bump when the checks change so cached results are redone
+VERIFIER_VERSION = 2
+
+# Longest mate claim that is searched, and the search budget per puzzle
+MAX_MATE_DEPTH = 5
+NODE_LIMIT = 2000000
+
+
+def line_problem(board, solution):
+    """Why a solution line cannot be played out from board, or None"""
+    try:
+        line = [chess.Move.from_uci(uci) for uci in solution.split()]
+    except ValueError:
+        return f"solution {solution!r} is not a line of UCI moves"
+    if not line:
+        return "solution is empty"
+    replay = board.copy(stack=False)
+    for ply, move in enumerate(line):
+        if move not in replay.legal_moves:
+            if ply == 0:
+                return f"solution {move} is not legal in this position"
+            return f"solution move {ply + 1} ({move}) is not legal"
+        replay.push(move)
+    return None
+
+
+def verify_puzzle(board, puzzle):
+    """Returns (status, reason) for a puzzle whose position parsed"""
+    if not board.is_valid():
+        return "invalid", "position is not legal"
+    problem = line_problem(board, puzzle["solution"])
+    if problem:
+        return "invalid", problem
+    move = chess.Move.from_uci(puzzle["solution"].split()[0])
+
+    match = MATE_PATTERN.search(puzzle.get("description", ""))
+    if not match:
+        return "ok", ""
+
+    mate_in = int(match.group(1))
+    if mate_in > MAX_MATE_DEPTH:
+        return "unverified", f"mate in {mate_in} is deeper than the search limit"
+
+    try:
+        if Solver(NODE_LIMIT).mates_after(board, move, mate_in):
+            return "ok", ""
+    except SearchLimitReached:
+        return "unverified", "search limit reached"
+    if mate_in == 1:
+        return "invalid", f"{board.san(move)} does not give mate"
+    return "invalid", f"{board.san(move)} does not force mate in {mate_in}"
+
+
+# Per worker process read-only connection to the result cache
+_cache = None
+
+
+def _open_cache(db_path):
+    global _cache
+    if _cache is None:
+        _cache = sqlite3.connect(db_path)
+    return _cache
+
+
+def verify_batch(db_path, table):
+    """Worker entry point, given a PuzzleTable of puzzles to check
+
+    Returns (id, cache key, status, reason, cached) per puzzle; the cache key
+    is None for puzzles whose FEN could not be parsed.
+    """
+    cache = _open_cache(db_path)
+    results = []
+    for index in range(len(table)):
+        puzzle = {
+            "id": table.id_at(index),
+            "description": table.description[index],
+            "solution": table.solution(index)
+        }
+        try:
+            # Built from the packed bitboards, no FEN parsing
+            board = table.board(index)
+        except ValueError as e:
+            results.append((puzzle["id"], None, "invalid", f"bad FEN: {e}", False))
+            continue
+
+        key = (position_hash(board), puzzle["solution"], puzzle["description"])
+        row = cache.execute(
+            "SELECT status, reason FROM verification "
+            "WHERE position_hash = ? AND solution = ? AND description = ? AND version = ?",
+            key + (VERIFIER_VERSION,)
+        ).fetchone()
+        if row:
+            results.append((puzzle["id"], key, row[0], row[1], True))
+        else:
+            status, reason = verify_puzzle(board, puzzle)
+            results.append((puzzle["id"], key, status, reason, False))
+    return results
+
+
+def verify_store(store, workers=None, batch_size=2000, on_result=None):
+    """Verify every puzzle in the store, returns a dict of counts
+
+    on_result(puzzle_id, status, reason) is called for each puzzle that is
+    not "ok".
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = {"ok": 0, "invalid": 0, "unverified": 0, "cached": 0}
+
+    def collect(future):
+        fresh = []
+        for puzzle_id, key, status, reason, cached in future.result():
+            counts[status] += 1
+            if cached:
+                counts["cached"] += 1
+            elif key is not None:
+                fresh.append(key + (VERIFIER_VERSION, status, reason))
+            if status != "ok" and on_result:
+                on_result(puzzle_id, status, reason)
+        if fresh:
+            with store.lock, store.conn:
+                store.conn.executemany(
+                    "INSERT OR REPLACE INTO verification "
+                    "(position_hash, solution, description, version, status, reason) VALUES (?, ?, ?, ?, ?, ?)",
+                    fresh
+                )
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        # Batches go to the workers packed, a fraction of the size of dicts
+        for table in store.iter_tables(batch_size):
+            pending.append(pool.submit(verify_batch, store.path, table))
+            while len(pending) >= workers * 2 or (pending and pending[0].done()):
+                collect(pending.pop(0))
+        for future in pending:
+            collect(future)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the puzzles in the Chess Puzzle Alarm database")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="puzzle database path")
+    parser.add_argument("--report", help="write puzzles that failed verification to this JSON-lines file")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    store = PuzzleStore(args.db)
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+
+    def on_result(puzzle_id, status, reason):
+        puzzle = store.get(puzzle_id)
+        print(f"#{puzzle_id} {status}: {reason} ({puzzle['description']}, {puzzle['fen']})")
+        if report:
+            report.write(json.dumps(dict(puzzle, status=status, reason=reason)) + "\n")
+
+    start = time.perf_counter()
+    try:
+        counts = verify_store(store, workers=args.workers, on_result=on_result)
+    finally:
+        if report:
+            report.close()
+        store.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{counts['ok']} ok, {counts['invalid']} invalid, {counts['unverified']} unverified "
+          f"({counts['cached']} from cache) in {elapsed:.1f}s")
+    return 1 if counts["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
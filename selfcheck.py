@@ -0,0 +1,166 @@
+"""Headless behaviour checks for the app's core logic
+
+Each check exercises one component end to end and reports whether it
+behaved: the alarm journal's crash recovery and locking, repeat rules
+across daylight saving changes, and which puzzle answers are accepted.
+Nothing needs a display, and files are written to a temporary directory
+only.
+
+    python selfcheck.py
+    python selfcheck.py --only journal
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import chess
+
+from alarm_daemon import SOLVER_NODE_LIMIT
+from alarm_recurrence import first_occurrence, next_occurrence
+from alarm_store import AlarmStore, JournalLockedError, fcntl
+from puzzle_solver import PuzzleSession, Solver
+from puzzle_store import BUILTIN_PUZZLES
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def journal_store(directory):
+    return AlarmStore(os.path.join(directory, "alarms.journal"), os.path.join(directory, "alarms.snapshot.json"))
+
+
+def check_journal(directory):
+    """A torn last record is cut off on load, and a locked journal is left alone"""
+    morning = datetime.datetime(2030, 1, 1, 7, 0)
+    store = journal_store(directory)
+    store.load()
+    store.add_many([{"id": 1, "time": morning}, {"id": 2, "time": morning + datetime.timedelta(days=1)}])
+    good_size = os.path.getsize(store.journal_path)
+    # A crash part way through the next record
+    store.journal.write('{"op": "add", "alarm": {"id": 3, "ti')
+    store.close()
+
+    store = journal_store(directory)
+    expect([alarm["id"] for alarm in store.load()] == [1, 2], "alarms before a torn record were not recovered")
+    expect(os.path.getsize(store.journal_path) == good_size, "the torn record was not cut off")
+    store.add({"id": 3, "time": morning})
+    store.close()
+    store = journal_store(directory)
+    expect(len(store.load()) == 3, "an alarm written after the repair was lost")
+
+    if fcntl is None:
+        store.close()
+        return
+    store.journal.write('{"op": "del", "i')
+    store.journal.flush()
+    size = os.path.getsize(store.journal_path)
+    second = journal_store(directory)
+    try:
+        second.load()
+        raise CheckFailed("a second store opened a locked journal")
+    except JournalLockedError:
+        pass
+    expect(os.path.getsize(store.journal_path) == size, "a second store changed a journal it could not lock")
+    store.close()
+
+
+def check_recurrence(directory):
+    """Repeat rules keep the wall-clock time across daylight saving changes"""
+    day = datetime.datetime
+    hours = lambda earlier, later: (later.timestamp() - earlier.timestamp()) / 3600
+
+    expect(next_occurrence({"time": day(2025, 3, 7, 7, 0), "repeat": "weekdays"}, day(2025, 3, 7, 7, 0))
+           == day(2025, 3, 10, 7, 0), "a weekdays alarm on Friday did not move to Monday")
+    expect(first_occurrence("cron 30 7 * * 1-5", day(2025, 11, 1, 0, 0), day(2025, 11, 1, 0, 0))
+           == day(2025, 11, 3, 7, 30), "a cron rule did not skip the weekend")
+
+    # Local time decides when an alarm rings, so pin a zone with both changes
+    if not hasattr(time, "tzset"):
+        return
+    saved = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    try:
+        spring = {"time": day(2025, 3, 8, 7, 0), "repeat": "daily"}
+        following = next_occurrence(spring, spring["time"])
+        expect(following == day(2025, 3, 9, 7, 0), f"daily 07:00 moved to {following} over the spring change")
+        expect(hours(spring["time"], following) == 23, "the spring change was not skipped in the alarm's clock time")
+
+        autumn = {"time": day(2025, 11, 1, 7, 0), "repeat": "daily"}
+        following = next_occurrence(autumn, autumn["time"])
+        expect(following == day(2025, 11, 2, 7, 0), f"daily 07:00 moved to {following} over the autumn change")
+        expect(hours(autumn["time"], following) == 25, "the repeated autumn hour was not counted")
+
+        # 02:30 does not exist on the day clocks go forward; it rings at 03:30
+        gap = {"time": day(2025, 3, 8, 2, 30), "repeat": "daily"}
+        following = next_occurrence(gap, gap["time"])
+        expect(following.timestamp() == day(2025, 3, 9, 3, 30).timestamp(),
+               "an alarm in the spring gap did not ring just after it")
+    finally:
+        if saved is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = saved
+        time.tzset()
+
+
+def puzzle_answer(puzzle, uci):
+    session = PuzzleSession(chess.Board(puzzle["fen"]), puzzle, Solver(SOLVER_NODE_LIMIT))
+    return session.submit(chess.Move.from_uci(uci))[0]
+
+
+def check_solver(directory):
+    """A puzzle accepts its answer and equal alternatives, and rejects a wrong move"""
+    # White is already ahead here, which once let every quiet move through
+    puzzle = next(puzzle for puzzle in BUILTIN_PUZZLES if puzzle["solution"] == "d3d4")
+    expect(puzzle_answer(puzzle, "d3d4") == "solved", "the stored solution was rejected")
+    for uci in ("h2h3", "a3a4"):
+        expect(puzzle_answer(puzzle, uci) == "wrong", f"{uci} was accepted in a position it does not win")
+
+    # Either piece may take the queen
+    puzzle = {"fen": "4k3/8/8/3q4/8/8/6B1/3RK3 w - - 0 1", "solution": "d1d5", "description": "Win the queen"}
+    expect(puzzle_answer(puzzle, "g2d5") == "solved", "an equally winning capture was rejected")
+    expect(puzzle_answer(puzzle, "g2h3") == "wrong", "a move that leaves the queen was accepted")
+
+    puzzle = next(puzzle for puzzle in BUILTIN_PUZZLES if puzzle["solution"] == "h5f7")
+    expect(puzzle_answer(puzzle, "h5f7") == "solved", "the mate was not accepted")
+    expect(puzzle_answer(puzzle, "h5e5") == "wrong", "a move that does not mate was accepted")
+
+
+CHECKS = {
+    "journal": check_journal,
+    "recurrence": check_recurrence,
+    "solver": check_solver,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Chess Puzzle Alarm behaviour checks")
+    parser.add_argument("--only", action="append", choices=tuple(CHECKS), help="run only these checks (repeatable)")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for name in args.only or CHECKS:
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                CHECKS[name](directory)
+            except CheckFailed as e:
+                failed += 1
+                print(f"FAIL {name}: {e}")
+                continue
+        print(f"ok   {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
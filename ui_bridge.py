@@ -0,0 +1,95 @@
+import collections
+import sys
+import threading
+import time
+
+import metrics
+
+
+class UIBridge:
+    """Queue that lets background threads run code on the Tk main loop
+
+    Tk widgets may only be touched from the thread running mainloop. Worker
+    threads call post() (or post_coalesced() for refreshes where only the
+    latest request matters) and the main loop drains the queue from a
+    root.after callback. Each drain stops after time_budget seconds and
+    yields back to Tk, so a burst of work can never hold up event handling
+    for longer than one budget slice.
+
+    While the queue stays empty the poll interval doubles up to
+    max_poll_interval, so an idle window wakes a few times a second rather
+    than twenty; that interval is also the bound on how long a post can
+    wait. The wait of every callback is recorded in metrics.UI_QUEUE_LATENCY.
+    """
+
+    def __init__(self, root, poll_interval=50, max_poll_interval=250, time_budget=0.008):
+        self.root = root
+        self.poll_interval = poll_interval          # ms between drains after work was done
+        self.max_poll_interval = max_poll_interval  # ms between drains once idle
+        self.interval = poll_interval
+        self.time_budget = time_budget              # s of queued work per drain
+        self.lock = threading.Lock()
+        self.queue = collections.deque()    # (posted at, key, callback, args)
+        self.coalesced = {}                 # key -> (callback, args) of latest request
+        self.main_thread = threading.current_thread()
+
+        self.after_id = self.root.after(self.interval, self.drain)
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the main loop"""
+        with self.lock:
+            self.queue.append((time.perf_counter(), None, callback, args))
+
+    def post_coalesced(self, key, callback, *args):
+        """Run callback(*args) on the main loop, merging repeated requests
+
+        Any number of posts with the same key before the next drain result
+        in a single call with the most recent arguments.
+        """
+        with self.lock:
+            if key in self.coalesced:
+                metrics.UI_POSTS_MERGED.inc()
+            else:
+                self.queue.append((time.perf_counter(), key, None, None))
+            self.coalesced[key] = (callback, args)
+
+    def call(self, callback, *args):
+        """Run callback now if on the main thread, otherwise post it"""
+        if threading.current_thread() is self.main_thread:
+            callback(*args)
+        else:
+            self.post(callback, *args)
+
+    def drain(self):
+        deadline = time.perf_counter() + self.time_budget
+        executed = 0
+        while True:
+            with self.lock:
+                if not self.queue:
+                    break
+                posted, key, callback, args = self.queue.popleft()
+                if key is not None:
+                    callback, args = self.coalesced.pop(key)
+
+            metrics.UI_QUEUE_LATENCY.observe(time.perf_counter() - posted)
+            executed += 1
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in UI callback {callback!r}: {e}", file=sys.stderr)
+
+            if time.perf_counter() >= deadline:
+                break
+
+        # Come straight back if work is left over, after Tk handles its events
+        with self.lock:
+            backlog = len(self.queue)
+        metrics.UI_QUEUE_DEPTH.set(backlog)
+        if backlog:
+            self.after_id = self.root.after(1, self.drain)
+            return
+        if executed:
+            self.interval = self.poll_interval
+        else:
+            self.interval = min(2 * self.interval, self.max_poll_interval)
+        self.after_id = self.root.after(self.interval, self.drain)